@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# coding: utf-8
+#
+#  Copyright (c) 2012, Adam Turcotte (adam.turcotte@gmail.com)
+#                      Nicolas Robidoux (nicolas.robidoux@gmail.com)
+#  License: BSD 2-Clause License
+#
+#  This file is part of the
+#  EXQUIRES (EXtensible QUantitative Image RESampling) test suite
+#
+
+"""Manage the metric results cached across all projects.
+
+Unless :option:`--no-cache` is given, :ref:`exquires-run` and
+:ref:`exquires-update` look up each metric result in a cache shared by all of
+the projects of the user before computing it, and store the results they
+compute. A result is identified by the contents of the master image, the
+downsampling, upsampling, and metric commands (with the ratio and sizes filled
+in), and the versions of **EXQUIRES**, of the programs, worker scripts, and
+Python modules that run the commands, and of VIPS and NumPy, which compute the
+metrics, so it is reused by any project that computes the same result.
+
+The cache is stored in :file:`~/.exquires/cache.db`, or in the file given by
+the :envvar:`EXQUIRES_CACHE` environment variable. Once the number of cached
+results exceeds the limit, the least recently used results are evicted at the
+end of each run.
+
+Use :option:`--limit` to change the limit (evicting results if necessary) and
+:option:`--clear` to remove all cached results.
+
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+from subprocess import CalledProcessError, STDOUT, check_output
+
+import numpy
+
+from exquires import compare, parsing, tools, workers
+from exquires import __version__ as VERSION
+
+# Default maximum number of cached results.
+LIMIT = 1000000
+
+# Versions of the programs that have been queried.
+_VERSIONS = {}
+
+# Versions of the Python modules that have been imported.
+_MODULES = {}
+
+# Digests of the scripts and source files that have been read.
+_SOURCES = {}
+
+
+class Cache(object):
+
+    """This class provides an interface to the cache of metric results.
+
+    :param path: cache file to connect to
+    :type path:  `path`
+
+    """
+
+    def __init__(self, path):
+        """Create a new :class:`Cache` object."""
+        tools.create_dir(os.path.dirname(os.path.abspath(path)))
+        self.dbase = sqlite3.connect(path)
+        self.dbase.text_factory = str
+        self.dbase.execute('CREATE TABLE IF NOT EXISTS RESULTS (key TEXT'
+                           ' PRIMARY KEY, result DOUBLE, low DOUBLE,'
+                           ' high DOUBLE, used DOUBLE )')
+        self.dbase.execute('CREATE TABLE IF NOT EXISTS SETTINGS (name TEXT'
+                           ' PRIMARY KEY, value INTEGER )')
+        self.dbase.commit()
+
+    def key(self, master_hash, commands, options=''):
+        """Return the key of a metric result.
+
+        :param master_hash: digest of the master image
+        :param commands:    downsampling, upsampling, and metric commands
+        :param options:     any other option that affects the result
+        :type master_hash:  `string`
+        :type commands:     `list of strings`
+        :type options:      `string`
+
+        :return:            the hexadecimal key
+        :rtype:             `string`
+
+        """
+        parts = [VERSION, master_hash, options]
+        for command in commands:
+            parts.extend([command, tool_version(command)])
+        return hashlib.sha1('\n'.join(parts)).hexdigest()
+
+    def get(self, key):
+        """Return a cached metric result.
+
+        :param key: key of the result
+        :type key:  `string`
+
+        :return:    the result and its confidence interval (`None` if exact),
+                    or `None` if the result is not cached
+        :rtype:     `tuple`
+
+        """
+        row = self.dbase.execute('SELECT result, low, high FROM RESULTS'
+                                 ' WHERE key = ?', [key]).fetchone()
+        if row is None:
+            return None
+        self.dbase.execute('UPDATE RESULTS SET used = ? WHERE key = ?',
+                           [time.time(), key])
+        return row[0], None if row[1] is None else (row[1], row[2])
+
+    def put(self, key, result, bounds=None):
+        """Store a metric result.
+
+        The result is only saved to the cache file by :meth:`commit`.
+
+        :param key:    key of the result
+        :param result: the result
+        :param bounds: lower and upper bounds of an approximate result
+        :type key:     `string`
+        :type result:  `float`
+        :type bounds:  `tuple of floats`
+
+        """
+        low, high = bounds or (None, None)
+        self.dbase.execute('INSERT OR REPLACE INTO RESULTS VALUES'
+                           ' (?, ?, ?, ?, ?)',
+                           [key, result, low, high, time.time()])
+
+    def __len__(self):
+        """Return the number of cached results.
+
+        :return: the number of cached results
+        :rtype:  `integer`
+
+        """
+        return self.dbase.execute('SELECT COUNT(*) FROM RESULTS').fetchone()[0]
+
+    def get_limit(self):
+        """Return the maximum number of cached results.
+
+        :return: the limit
+        :rtype:  `integer`
+
+        """
+        row = self.dbase.execute('SELECT value FROM SETTINGS'
+                                 ' WHERE name = \'limit\'').fetchone()
+        return LIMIT if row is None else row[0]
+
+    def set_limit(self, limit):
+        """Change the maximum number of cached results.
+
+        :param limit: the new limit
+        :type limit:  `integer`
+
+        """
+        self.dbase.execute('INSERT OR REPLACE INTO SETTINGS VALUES'
+                           ' (\'limit\', ?)', [limit])
+        self.dbase.commit()
+
+    def evict(self):
+        """Remove the least recently used results that exceed the limit.
+
+        :return: the number of results removed
+        :rtype:  `integer`
+
+        """
+        excess = len(self) - self.get_limit()
+        if excess <= 0:
+            return 0
+        self.dbase.execute('DELETE FROM RESULTS WHERE key IN (SELECT key'
+                           ' FROM RESULTS ORDER BY used LIMIT ?)', [excess])
+        self.dbase.commit()
+        return excess
+
+    def clear(self):
+        """Remove all cached results."""
+        self.dbase.execute('DELETE FROM RESULTS')
+        self.dbase.commit()
+        self.dbase.execute('VACUUM')
+
+    def commit(self):
+        """Save the results stored and used since the last commit."""
+        self.dbase.commit()
+
+    def close(self):
+        """Save any remaining changes and close the connection to the cache."""
+        self.dbase.commit()
+        self.dbase.close()
+
+
+def default_path():
+    """Return the path of the cache file.
+
+    :return: the value of :envvar:`EXQUIRES_CACHE`, or
+             :file:`~/.exquires/cache.db` if it is not set
+    :rtype:  `path`
+
+    """
+    return os.environ.get('EXQUIRES_CACHE', os.path.join(
+        os.path.expanduser('~'), '.exquires', 'cache.db'))
+
+
+def tool_version(command):
+    """Return the version of the program that runs a command.
+
+    The program is asked for its version with `-version` (as used by
+    ImageMagick) or `--version`. The metrics of :ref:`exquires-compare` have
+    the versions of VIPS and NumPy, which compute them, and metric plugins
+    (see :func:`compare.load_metric`) and Python functions also have the
+    version of their module. Other commands run by **EXQUIRES** itself have
+    the version of **EXQUIRES**, which is already part of each key. For a
+    worker (see :mod:`workers`), the program that runs the worker is asked,
+    and the digest of any script or module it runs is added.
+
+    :param command: the command
+    :type command:  `string`
+
+    :return:        the versions, separated by spaces (empty if unknown)
+    :rtype:         `string`
+
+    """
+    words = command.split()
+    if workers.is_worker(command):
+        words = command[len(workers.PREFIX):].split()
+        if not words:
+            return ''
+
+        # The worker script or module can change without its interpreter.
+        versions = [_program_version(words[0])]
+        for index, word in enumerate(words):
+            if index and words[index - 1] == '-m':
+                versions.append(_module_version(word))
+            elif os.path.isfile(word):
+                versions.append(_file_version(word))
+        return ' '.join(filter(None, versions))
+    program = words[0] if words else ''
+    if workers.is_python(program):
+        return _module_version(program[len(workers.PYTHON_PREFIX):])
+    if os.path.basename(program) == 'exquires-compare' and len(words) > 1:
+        versions = [_program_version('vips'), numpy.__version__]
+        source = compare.get_metrics().get(words[1], words[1])
+        if ':' in source:
+            versions.append(_module_version(source))
+        return ' '.join(filter(None, versions))
+    if program.startswith('exquires-') or not program:
+        return ''
+    return _program_version(program)
+
+
+def _program_version(program):
+    """Private function to return the version printed by a program.
+
+    .. note::
+
+        This is a private function called by :func:`tool_version`.
+
+    :param program: the program
+    :type program:  `string`
+
+    :return:        the first line printed by the program (empty if unknown)
+    :rtype:         `string`
+
+    """
+    if program not in _VERSIONS:
+        _VERSIONS[program] = ''
+        for flag in ('-version', '--version'):
+            try:
+                output = check_output([program, flag], stderr=STDOUT)
+            except (OSError, CalledProcessError):
+                continue
+            _VERSIONS[program] = (output.splitlines() or [''])[0]
+            break
+    return _VERSIONS[program]
+
+
+def _file_version(path):
+    """Private function to return the digest of a script.
+
+    .. note::
+
+        This is a private function called by :func:`tool_version` and
+        :func:`_module_version`.
+
+    :param path: the script
+    :type path:  `path`
+
+    :return:     the SHA-1 digest of the script
+    :rtype:      `string`
+
+    """
+    path = os.path.abspath(path)
+    if path not in _SOURCES:
+        _SOURCES[path] = tools.hash_file(path)
+    return _SOURCES[path]
+
+
+def _module_version(path):
+    """Private function to return the version of the module of a function.
+
+    .. note::
+
+        This is a private function called by :func:`tool_version`.
+
+    The version is the `__version__` of the module followed by the digest of
+    its source file, so that editing the function invalidates its results.
+
+    :param path: the path of the function, as `module:function`
+    :type path:  `string`
+
+    :return:     the version (empty if the module cannot be imported)
+    :rtype:      `string`
+
+    """
+    module = path.split(':')[0]
+    if module not in _MODULES:
+        try:
+            imported = __import__(module, globals(), locals(),
+                                  ['__version__'], 0)
+        except ImportError:
+            return ''
+        source = getattr(imported, '__file__', None) or ''
+        if os.path.splitext(source)[1] in ('.pyc', '.pyo'):
+            source = source[:-1]
+        digest = _file_version(source) if os.path.isfile(source) else ''
+        _MODULES[module] = ' '.join([
+            str(getattr(imported, '__version__', '')), digest
+        ]).strip()
+    return _MODULES[module]
+
+
+def main():
+    """Run :ref:`exquires-cache`.
+
+    Print the number of cached results and the limit, after applying any
+    change requested on the command line.
+
+    """
+    # Define the command-line argument parser.
+    parser = parsing.ExquiresParser(description=__doc__)
+    parser.add_argument('-l', '--limit', metavar='RESULTS', type=int,
+                        help='keep at most this many results')
+    parser.add_argument('-c', '--clear', action='store_true',
+                        help='remove all cached results')
+
+    # Attempt to parse the command-line arguments.
+    args = parser.parse_args()
+    if args.limit is not None and args.limit < 0:
+        parser.error('the limit must not be negative')
+
+    # Apply the requested changes.
+    path = default_path()
+    results = Cache(path)
+    if args.clear:
+        results.clear()
+    if args.limit is not None:
+        results.set_limit(args.limit)
+        results.evict()
+
+    # Print the state of the cache.
+    print '{} ({} results, limit: {})'.format(path, len(results),
+                                              results.get_limit())
+    results.close()
+
+if __name__ == '__main__':
+    main()
@@ -24,6 +24,10 @@
     cmc_2       :math:`\ell_2` norm using the CMC(1:1) colour difference
     cmc_4       :math:`\ell_4` norm using the CMC(1:1) colour difference
     cmc_inf     :math:`\ell_\infty` norm using the CMC(1:1) colour difference
+    de2000_1    :math:`\ell_1` norm using the CIEDE2000 colour difference
+    de2000_2    :math:`\ell_2` norm using the CIEDE2000 colour difference
+    de2000_4    :math:`\ell_4` norm using the CIEDE2000 colour difference
+    de2000_inf  :math:`\ell_\infty` norm using the CIEDE2000 colour difference
     xyz_1       :math:`\ell_1` norm in XYZ colour space
     xyz_2       :math:`\ell_2` norm in XYZ colour space
     xyz_4       :math:`\ell_4` norm in XYZ colour space
@@ -33,15 +37,279 @@
     blur_4      MSSIM-inspired :math:`\ell_4` norm
     blur_inf    MSSIM-inspired :math:`\ell_\infty` norm
     mssim       Mean Structural Similarity Index (MSSIM)
+    issim       MSSIM computed with integral images
+    ms_ssim     Multi-Scale Structural Similarity Index (MS-SSIM)
     =========== =================================================
 
+  Metric plugins can be given by name or as `module:function` (see --list).
+
 """
 
+import argparse
+import hashlib
 import inspect
 import os
+import sys
+import tempfile
+import threading
 from math import exp
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from subprocess import check_output
+
+import numpy
+
+from exquires import parsing, sketch
+
+# NumPy data types corresponding to the VIPS band formats.
+_BANDFMT = {0: numpy.uint8, 1: numpy.int8, 2: numpy.uint16, 3: numpy.int16,
+            4: numpy.uint32, 5: numpy.int32, 6: numpy.float32,
+            8: numpy.float64}
+
+# Path to the sRGB profile and the rendering intent used for Lab import.
+_SRGB_PROFILE = os.path.join(os.path.dirname(__file__),
+                             'sRGB_IEC61966-2-1_black_scaled.icc')
+_INTENT = 1    # IM_INTENT_RELATIVE_COLORIMETRIC
+
+# Signatures of the TIFF files written to standard output by upsamplers.
+_TIFF_MAGIC = ('II*\x00', 'MM\x00*')
+
+# Exponents of the contrast-structure terms of each MS-SSIM scale.
+_MS_SSIM_WEIGHTS = [0.0448, 0.2856, 0.3001, 0.2363, 0.1333]
+
+# Every Nth single precision result of a metric is checked by the engine.
+_CHECK_INTERVAL = 50
+
+# Relative error above which the engine warns about a single precision result.
+_CHECK_TOLERANCE = 1e-4
+
+# Number of strips assigned to each thread when splitting an image.
+_STRIPS_PER_THREAD = 4
+
+# Thread pools shared by all comparisons, keyed by size.
+_POOLS = {}
+
+# Number of strata (bands of rows) sampled by the approximate mode.
+_STRATA = 32
+
+# Critical value of the normal distribution for a 95% confidence interval.
+_Z_95 = 1.96
+
+# Per-pixel maps that can be saved by the engine.
+MAPS = ['diff', 'cmc', 'ssim']
+
+# Entry point group under which metric plugins are registered.
+_ENTRY_POINT_GROUP = 'exquires.metrics'
+
+# Metric functions that have already been loaded, keyed by name.
+_LOADED = {}
+
+# Planes that can be mapped into memory from a directory shared by processes.
+_SHARED = ['rgb', 'gray', 'lab', 'xyz', 'ucs']
+
+
+class Planes(object):
+
+    """This class provides the decoded and derived planes of an image.
+
+    Each plane is a NumPy array computed on first use and kept until the
+    object is destroyed, so metrics sharing an image only decode it once.
+    Planes are computed under a lock, so the threads evaluating the strips of
+    a metric also share a single copy of each plane.
+    The following planes are available:
+
+        * `rgb` -- the decoded sRGB pixels (height x width x 3)
+        * `gray` -- the Y channel of YIQ colour space (height x width)
+        * `xyz` -- the pixels in XYZ colour space (height x width x 3)
+        * `lab` -- the pixels in CIE L*a*b* colour space (height x width x 3)
+        * `ucs` -- the pixels in CMC(1:1) colour space (height x width x 3)
+        * `pyramid` -- the dyadic pyramid of the `gray` plane used by MS-SSIM
+
+    If the pixels are given, they are used instead of decoding the image.
+    NumPy images (:file:`.npy`) are mapped into memory rather than read, and
+    VIPS images (:file:`.v`) are mapped into memory by VIPS.
+
+    If a directory is given, the `rgb`, `gray`, `xyz`, `lab`, and `ucs`
+    planes are saved to it when first computed and mapped into memory
+    read-only. Any other :class:`Planes` object given the same directory, in
+    this process or in another one, maps the saved planes instead of computing
+    them again.
+
+    :param image:     image to decode
+    :param pixels:    decoded sRGB pixels (height x width x 3)
+    :param directory: directory to share the planes through
+    :type image:      `path`
+    :type pixels:     :class:`numpy.ndarray`
+    :type directory:  `path`
+
+    """
+
+    def __init__(self, image, pixels=None, directory=None):
+        """Create a new :class:`Planes` object."""
+        self.image = image
+        self.directory = directory
+        self.cache = {}
+        self.lock = threading.RLock()
+        if pixels is None and os.path.splitext(image)[1] == '.npy':
+            pixels = numpy.load(image, mmap_mode='r')
+        if pixels is not None:
+            self.cache['rgb'] = pixels
+
+    @property
+    def vimage(self):
+        """The VIPS image used to decode the pixels and derive the planes."""
+        return self.setdefault('vimage', self._vimage)
+
+    def rows(self):
+        """Return the number of rows of the image.
+
+        The rows of given, mapped, or shared pixels are counted from their
+        array, so that VIPS is only involved for an image it decodes anyway.
+
+        :return: the number of rows
+        :rtype:  `integer`
+
+        """
+        if 'rgb' in self.cache or self.directory:
+            return self.get('rgb').shape[0]
+        return self.vimage.Ysize()
+
+    def get(self, name, dtype=None):
+        """Return the named plane, computing it if necessary.
+
+        If a data type is specified, a copy of the plane converted to that
+        type is cached and returned instead.
+
+        :param name:  name of the plane
+        :param dtype: data type of the plane (default: its natural type)
+        :type name:   `string`
+        :type dtype:  :class:`numpy.dtype`
+
+        :return:      the plane
+        :rtype:       :class:`numpy.ndarray`
+
+        """
+        func = getattr(self, '_'.join(['', name]))
+        if self.directory and name in _SHARED:
+            plane = self.setdefault(name, lambda: self._shared(name, func))
+        else:
+            plane = self.setdefault(name, func)
+        if dtype is None:
+            return plane
+        return self.setdefault((name, numpy.dtype(dtype).str),
+                               lambda: _astype(plane, dtype))
+
+    def setdefault(self, key, func):
+        """Return the cached value for a key, calling `func` if necessary.
+
+        This is used to cache data derived from several planes, such as the
+        blurred statistics of each level of the pyramid.
+
+        :param key:  key of the cached value
+        :param func: computes the value if it is not cached
+        :type key:   `hashable`
+        :type func:  `function`
+
+        :return:     the cached value
+
+        """
+        if key not in self.cache:
+            with self.lock:
+                if key not in self.cache:
+                    self.cache[key] = func()
+        return self.cache[key]
+
+    def _shared(self, name, func):
+        """Private method to map a plane saved to the shared directory.
+
+        The plane is computed and saved first if no process has saved it yet.
+        It is written to a temporary file with a unique name and then renamed,
+        so other processes and threads never map a partially written plane.
+
+        :param name: name of the plane
+        :param func: computes the plane
+        :type name:  `string`
+        :type func:  `function`
+
+        :return:     the plane, mapped into memory read-only
+        :rtype:      :class:`numpy.memmap`
+
+        """
+        path = os.path.join(self.directory, '.'.join([name, 'npy']))
+        if not os.path.isfile(path):
+            handle, temp = tempfile.mkstemp('.npy', name, self.directory)
+            with os.fdopen(handle, 'wb') as saved:
+                numpy.save(saved, numpy.asarray(func()))
+            os.rename(temp, path)
+        return numpy.load(path, mmap_mode='r')
+
+    def _vimage(self):
+        """Private method to open the image, or wrap the given pixels, in VIPS.
+
+        The VIPS image is only created when it is needed, so the colour planes
+        of an image whose pixels are given are derived from a copy of them.
+
+        """
+        vipscc = __import__('vipsCC', globals(), locals(), ['VImage'], -1)
+        if 'rgb' not in self.cache:
+            return vipscc.VImage.VImage(self.image)
+        pixels = self.cache['rgb']
+        fmt = [key for key, value in _BANDFMT.items()
+               if value == pixels.dtype.type][0]
+        self.buffer = pixels.astype(pixels.dtype.type).tostring()
+        return vipscc.VImage.VImage.frombuffer(
+            self.buffer, pixels.shape[1], pixels.shape[0], pixels.shape[2],
+            fmt)
+
+    def _rgb(self):
+        """Private method to decode the sRGB pixels."""
+        return _to_array(self.vimage)
+
+    def _gray(self):
+        """Private method to convert the sRGB pixels to grayscale.
+
+        The result is equivalent to the Y channel of YIQ colour space.
+
+        """
+        return numpy.dot(self.get('rgb'), [0.299, 0.587, 0.114])
+
+    def _pyramid(self):
+        """Private method to build a dyadic pyramid of the grayscale plane.
+
+        Each level is obtained by averaging 2x2 blocks of the previous level,
+        after dropping the last row or column if its size is odd.
+
+        """
+        levels = [self.get('gray')]
+        for dummy in range(1, len(_MS_SSIM_WEIGHTS)):
+            prev = levels[-1]
+            rows, cols = prev.shape[0] & ~1, prev.shape[1] & ~1
+            levels.append((prev[0:rows:2, 0:cols:2] +
+                           prev[1:rows:2, 0:cols:2] +
+                           prev[0:rows:2, 1:cols:2] +
+                           prev[1:rows:2, 1:cols:2]) / 4)
+        return levels
+
+    def _vips_lab(self):
+        """Private method to import the image into Lab colour space.
+
+        The result is a VIPS image used to derive the other colour planes.
 
-from exquires import parsing
+        """
+        return self.setdefault('vips_lab', lambda: self.vimage.icc_import(
+            _SRGB_PROFILE, _INTENT))
+
+    def _lab(self):
+        """Private method to import the pixels into Lab colour space."""
+        return _to_array(self._vips_lab())
+
+    def _xyz(self):
+        """Private method to import the pixels into XYZ colour space."""
+        return _to_array(self._vips_lab().Lab2XYZ())
+
+    def _ucs(self):
+        """Private method to import the pixels into CMC(1:1) colour space."""
+        return _to_array(self._vips_lab().Lab2UCS())
 
 
 class Metrics(object):
@@ -61,31 +329,70 @@ class Metrics(object):
     The CMC and XYZ errors can be slightly outside the range [0, 100], but this
     will not occur for most image pairs.
 
+    The arithmetic is performed with NumPy on horizontal strips of the images,
+    which are evaluated by a pool of threads. NumPy releases the GIL while
+    operating on arrays, so a single comparison can make use of several cores.
+    The partial sums of each strip are merged to produce the final result.
+
+    The intermediates are computed in double precision by default. Single
+    precision halves the memory traffic and doubles the number of values
+    processed by each SIMD instruction, at the cost of some accuracy. Sums
+    over strips and summed-area tables are always accumulated in double
+    precision.
+
     .. note::
 
         By default, a :class:`Metrics` object is configured to operate on
         16-bit images.
 
-    :param image1: first image to compare (reference image)
-    :param image2: second image to compare (test image)
-    :param L:      highest possible pixel value (default=65535)
-    :type image1:  `path`
-    :type image2:  `path`
-    :type L:       `integer`
+    Either image can be given as a :class:`Planes` object instead of a path,
+    which allows the decoded planes to be reused across several comparisons.
+
+    In approximate mode (`sample` < 1), the metrics are estimated from a
+    stratified random sample of the rows: the rows are divided into bands and
+    a block of consecutive rows is drawn from each band using a fixed seed.
+    :meth:`estimate` returns a 95% confidence interval along with the result.
+
+    Metric plugins (see :func:`load_metric`) are called with a
+    :class:`Metrics` object. They can use the cached planes of
+    :attr:`planes1` and :attr:`planes2`, and evaluate their own per-pixel
+    errors in parallel with :meth:`reduce`.
+
+    :param image1:    first image to compare (reference image)
+    :param image2:    second image to compare (test image)
+    :param maxval:    highest possible pixel value (default=65535)
+    :param threads:   number of threads used to evaluate strips (default=1)
+    :param window:    window shape used by :meth:`issim` (default='gaussian')
+    :param size:      window size used by :meth:`issim` (default=11)
+    :param precision: data type of the intermediates (default='float64')
+    :param sample:    fraction of the rows to sample (default=1, exact)
+    :param seed:      seed used to choose the sampled rows (default=0)
+    :type image1:     `path` or :class:`Planes`
+    :type image2:     `path` or :class:`Planes`
+    :type maxval:     `integer`
+    :type threads:    `integer`
+    :type window:     `string`
+    :type size:       `integer`
+    :type precision:  `string`
+    :type sample:     `float`
+    :type seed:       `integer`
 
     """
 
-    def __init__(self, image1, image2, maxval=65535):
+    def __init__(self, image1, image2, maxval=65535, threads=1,
+                 window='gaussian', size=11, precision='float64', sample=1,
+                 seed=0):
         """Create a new :class:`Metrics` object."""
-        vipscc = __import__('vipsCC', globals(), locals(),
-                           ['VImage', 'VMask'], -1)
-        self.vmask = vipscc.VMask
-        self.im1 = vipscc.VImage.VImage(image1)
-        self.im2 = vipscc.VImage.VImage(image2)
+        self.planes1 = image1 if isinstance(image1, Planes) else Planes(image1)
+        self.planes2 = image2 if isinstance(image2, Planes) else Planes(image2)
         self.maxval = maxval
-        self.srgb_profile = os.path.join(os.path.dirname(__file__),
-                                         'sRGB_IEC61966-2-1_black_scaled.icc')
-        self.intent = 1    # IM_INTENT_RELATIVE_COLORIMETRIC
+        self.threads = max(1, threads)
+        self.window = window
+        self.size = size
+        self.dtype = numpy.dtype(precision)
+        self.sample = sample
+        self.seed = seed
+        self.bounds = []
 
     def srgb_1(self):
         """Compute :math:`\ell_1` error in sRGB colour space.
@@ -105,8 +412,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        diff = self.im1.subtract(self.im2).abs().avg() / self.maxval
-        return diff * 100
+        return self._norm(self._srgb_error, 1) / self.maxval * 100
 
     def srgb_2(self):
         """Compute :math:`\ell_2` error in sRGB colour space.
@@ -126,8 +432,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        diff = self.im1.subtract(self.im2).pow(2).avg() ** 0.5 / self.maxval
-        return diff * 100
+        return self._norm(self._srgb_error, 2) / self.maxval * 100
 
     def srgb_4(self):
         """Compute :math:`\ell_4` error in sRGB colour space.
@@ -146,8 +451,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        diff = self.im1.subtract(self.im2).pow(4).avg() ** 0.25 / self.maxval
-        return diff * 100
+        return self._norm(self._srgb_error, 4) / self.maxval * 100
 
     def srgb_inf(self):
         """Compute :math:`\ell_\infty` error in sRGB colour space.
@@ -167,8 +471,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        diff = self.im1.subtract(self.im2).abs().max() / self.maxval
-        return diff * 100
+        return self._norm(self._srgb_error, numpy.inf) / self.maxval * 100
 
     def mssim(self):
         """Compute the Mean Structural Similarity Index (MSSIM).
@@ -203,36 +506,77 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        # Compute the SSIM constants from the highest possible pixel value.
-        const1 = (0.01 * self.maxval) ** 2
-        const_sum = const1 + (0.03 * self.maxval) ** 2
+        return self._mean(self._ssim_map, 5)
 
-        # Create the Gaussian blur mask.
-        blur = self.vmask.VDMask(11, 1, 1.0, 0, _get_blurlist())
+    def issim(self):
+        """Compute MSSIM using integral images.
 
-        # Compute a mask for converting the image to grayscale.
-        # Note that the result is equivalent to the Y channel of YIQ.
-        rgb2gray = self.vmask.VDMask(3, 1, 1, 0, [0.299, 0.587, 0.114])
+        The local means, variances, and covariance used by :eq:`ssim` are
+        computed from summed-area tables (integral images), so the cost per
+        pixel does not depend on the size of the window. The window is either
+        a box or an approximate Gaussian built from three successive boxes,
+        and its shape and size are set when creating the :class:`Metrics`
+        object.
 
-        # Convert the image to grayscale using Matlab's approach.
-        im1_g = self.im1.recomb(rgb2gray)
-        im2_g = self.im2.recomb(rgb2gray)
+        Once the SSIM map is computed, the border is trimmed by half the
+        window size and the mean is returned.
 
-        # Apply Gaussian blur to the grayscale images.
-        im1_b = im1_g.convsep(blur)
-        im2_b = im2_g.convsep(blur)
+        .. note::
 
-        # Compute the SSIM map.
-        tmp1 = im1_g.multiply(im2_g).convsep(blur).lin(2, const_sum)
-        tmp2 = im1_g.pow(2).add(im2_g.pow(2)).convsep(blur).lin(1, const_sum)
-        tmp3 = im1_b.multiply(im2_b).lin(2, const1)
-        tmp4 = im2_b.subtract(im1_b).pow(2).add(tmp3)
-        tmp5 = tmp3.multiply(tmp1.subtract(tmp3))
-        ssim = tmp5.divide(tmp2.subtract(tmp4).multiply(tmp4))
+            The images are converted to grayscale before applying the
+            window. The grayscale conversion is equivalent to taking
+            the Y channel in YIQ colour space.
+
+        :return: mean SSIM
+        :rtype:  `float`
+
+        """
+        return self._mean(self._issim_map, self.size // 2)
+
+    def ms_ssim(self):
+        """Compute the Multi-Scale Structural Similarity Index (MS-SSIM).
+
+        The equation for MS-SSIM is
+
+        .. math::
+            :label: ms_ssim
+
+            MS\\text{-}SSIM(x,y) = [l_M(x,y)]^{\\alpha_M}
+                \\prod_{j=1}^{M} [c_j(x,y) s_j(x,y)]^{\\beta_j}
+
+        where :math:`c_j s_j` is the mean contrast-structure term of
+        :eq:`ssim` at scale :math:`j` and :math:`l_M` is the mean luminance
+        term at the coarsest scale. The exponents are those proposed by
+        Wang et. al. for :math:`M = 5` scales.
+
+        The scales are the levels of a dyadic pyramid of the grayscale images.
+        The pyramid and the blurred statistics of each level are cached by the
+        :class:`Planes` of each image, so they are shared by every comparison
+        made against the same reference image.
 
-        # Crop the SSIM map and return the average.
-        return ssim.extract_area(5, 5,
-                                 im1_g.Xsize() - 10, im1_g.Ysize() - 10).avg()
+        .. note::
+
+            The images are converted to grayscale before building the
+            pyramid. The grayscale conversion is equivalent to taking
+            the Y channel in YIQ colour space.
+
+        :return: MS-SSIM
+        :rtype:  `float`
+
+        """
+        result = 1.0
+        for level, weight in enumerate(_MS_SSIM_WEIGHTS):
+            # Compute the blurred statistics before evaluating the strips.
+            self._level_stats(self.planes1, level)
+            self._level_stats(self.planes2, level)
+
+            # The luminance term is only included at the coarsest scale.
+            lum = level == len(_MS_SSIM_WEIGHTS) - 1
+            mean = self._mean(lambda start, stop:
+                              self._ms_ssim_map(level, lum, start, stop),
+                              5, level)
+            result *= numpy.sign(mean) * numpy.abs(mean) ** weight
+        return result
 
     def blur_1(self):
         """Compute MSSIM-inspired :math:`\ell_1` error.
@@ -253,22 +597,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-
-        # Create the Gaussian blur mask.
-        blur = self.vmask.VDMask(11, 1, 1.0, 0, _get_blurlist())
-
-        # Compute a mask for converting the image to grayscale.
-        # Note that the result is equivalent to the Y channel of YIQ.
-        rgb2gray = self.vmask.VDMask(3, 1, 1, 0, [0.299, 0.587, 0.114])
-
-        # Convert the image to grayscale using Matlab's approach.
-        im1_g = self.im1.recomb(rgb2gray)
-        im2_g = self.im2.recomb(rgb2gray)
-
-        # Apply Gaussian blur, crop the difference and return the l_1 error.
-        diff = im1_g.convsep(blur).subtract(im2_g.convsep(blur))
-        crop = diff.extract_area(5, 5, im1_g.Xsize() - 10, im1_g.Ysize() - 10)
-        return (crop.abs().avg() / self.maxval) * 100
+        return self._norm(self._blur_error, 1, 5) / self.maxval * 100
 
     def blur_2(self):
         """Compute MSSIM-inspired :math:`\ell_2` error.
@@ -289,22 +618,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-
-        # Create the Gaussian blur mask.
-        blur = self.vmask.VDMask(11, 1, 1.0, 0, _get_blurlist())
-
-        # Compute a mask for converting the image to grayscale.
-        # Note that the result is equivalent to the Y channel of YIQ.
-        rgb2gray = self.vmask.VDMask(3, 1, 1, 0, [0.299, 0.587, 0.114])
-
-        # Convert the image to grayscale using Matlab's approach.
-        im1_g = self.im1.recomb(rgb2gray)
-        im2_g = self.im2.recomb(rgb2gray)
-
-        # Apply Gaussian blur, crop the difference and return the l_2 error.
-        diff = im1_g.convsep(blur).subtract(im2_g.convsep(blur))
-        crop = diff.extract_area(5, 5, im1_g.Xsize() - 10, im1_g.Ysize() - 10)
-        return (crop.pow(2).avg() ** 0.5 / self.maxval) * 100
+        return self._norm(self._blur_error, 2, 5) / self.maxval * 100
 
     def blur_4(self):
         """Compute MSSIM-inspired :math:`\ell_4` error.
@@ -325,22 +639,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-
-        # Create the Gaussian blur mask.
-        blur = self.vmask.VDMask(11, 1, 1.0, 0, _get_blurlist())
-
-        # Compute a mask for converting the image to grayscale.
-        # Note that the result is equivalent to the Y channel of YIQ.
-        rgb2gray = self.vmask.VDMask(3, 1, 1, 0, [0.299, 0.587, 0.114])
-
-        # Convert the image to grayscale using Matlab's approach.
-        im1_g = self.im1.recomb(rgb2gray)
-        im2_g = self.im2.recomb(rgb2gray)
-
-        # Apply Gaussian blur, crop the difference and return the l_4 error.
-        diff = im1_g.convsep(blur).subtract(im2_g.convsep(blur))
-        crop = diff.extract_area(5, 5, im1_g.Xsize() - 10, im1_g.Ysize() - 10)
-        return (crop.pow(4).avg() ** 0.25 / self.maxval) * 100
+        return self._norm(self._blur_error, 4, 5) / self.maxval * 100
 
     def blur_inf(self):
         """Compute MSSIM-inspired :math:`\ell_\infty` error.
@@ -361,22 +660,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-
-        # Create the Gaussian blur mask.
-        blur = self.vmask.VDMask(11, 1, 1.0, 0, _get_blurlist())
-
-        # Compute a mask for converting the image to grayscale.
-        # Note that the result is equivalent to the Y channel of YIQ.
-        rgb2gray = self.vmask.VDMask(3, 1, 1, 0, [0.299, 0.587, 0.114])
-
-        # Convert the image to grayscale using Matlab's approach.
-        im1_g = self.im1.recomb(rgb2gray)
-        im2_g = self.im2.recomb(rgb2gray)
-
-        # Apply Gaussian blur, crop the difference and return the l_inf error.
-        diff = im1_g.convsep(blur).subtract(im2_g.convsep(blur))
-        crop = diff.extract_area(5, 5, im1_g.Xsize() - 10, im1_g.Ysize() - 10)
-        return (crop.abs().max() / self.maxval) * 100
+        return self._norm(self._blur_error, numpy.inf, 5) / self.maxval * 100
 
     def cmc_1(self):
         """Compute :math:`\ell_1` error in Uniform Colour Space (UCS).
@@ -391,9 +675,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        lab1 = self.im1.icc_import(self.srgb_profile, self.intent)
-        lab2 = self.im2.icc_import(self.srgb_profile, self.intent)
-        return lab1.dECMC_fromLab(lab2).avg()
+        return self._norm(self._cmc_error, 1)
 
     def cmc_2(self):
         """Compute :math:`\ell_2` error in Uniform Colour Space (UCS).
@@ -408,9 +690,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        lab1 = self.im1.icc_import(self.srgb_profile, self.intent)
-        lab2 = self.im2.icc_import(self.srgb_profile, self.intent)
-        return lab1.dECMC_fromLab(lab2).pow(2).avg() ** 0.5
+        return self._norm(self._cmc_error, 2)
 
     def cmc_4(self):
         """Compute :math:`\ell_4` error in Uniform Colour Space (UCS).
@@ -425,9 +705,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        lab1 = self.im1.icc_import(self.srgb_profile, self.intent)
-        lab2 = self.im2.icc_import(self.srgb_profile, self.intent)
-        return lab1.dECMC_fromLab(lab2).pow(4).avg() ** 0.25
+        return self._norm(self._cmc_error, 4)
 
     def cmc_inf(self):
         """Compute :math:`\ell_\infty` error in Uniform Colour Space (UCS).
@@ -442,9 +720,86 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        lab1 = self.im1.icc_import(self.srgb_profile, self.intent)
-        lab2 = self.im2.icc_import(self.srgb_profile, self.intent)
-        return lab1.dECMC_fromLab(lab2).max()
+        return self._norm(self._cmc_error, numpy.inf)
+
+    def de2000_1(self):
+        """Compute :math:`\ell_1` error using CIEDE2000.
+
+        This method imports the images into Lab colour space, then calculates
+        the CIEDE2000 colour difference and returns the average.
+
+        The equation for the CIEDE2000 colour difference is
+
+        .. math::
+            :label: de2000
+
+            \Delta E_{00} = \sqrt{
+                \left(\\frac{\Delta L'}{S_L}\\right)^2 +
+                \left(\\frac{\Delta C'}{S_C}\\right)^2 +
+                \left(\\frac{\Delta H'}{S_H}\\right)^2 +
+                R_T \\frac{\Delta C'}{S_C} \\frac{\Delta H'}{S_H}}
+
+        where the lightness, chroma, and hue differences and the weighting
+        functions are those given by Sharma et. al. The difference is computed
+        for every pixel using array operations.
+
+        See :eq:`l_1` for details on how the standard :math:`\ell_1` norm is
+        computed.
+
+        :return: :math:`\ell_1` error using CIEDE2000
+        :rtype:  `float`
+
+        """
+        return self._norm(self._de2000_error, 1)
+
+    def de2000_2(self):
+        """Compute :math:`\ell_2` error using CIEDE2000.
+
+        This method imports the images into Lab colour space, then calculates
+        the CIEDE2000 colour difference and returns the :math:`\ell_2` norm.
+
+        See :eq:`de2000` for details on how the colour difference is computed,
+        and :eq:`l_2` for details on how the standard :math:`\ell_2` norm
+        is computed.
+
+        :return: :math:`\ell_2` error using CIEDE2000
+        :rtype:  `float`
+
+        """
+        return self._norm(self._de2000_error, 2)
+
+    def de2000_4(self):
+        """Compute :math:`\ell_4` error using CIEDE2000.
+
+        This method imports the images into Lab colour space, then calculates
+        the CIEDE2000 colour difference and returns the :math:`\ell_4` norm.
+
+        See :eq:`de2000` for details on how the colour difference is computed,
+        and :eq:`l_4` for details on how the standard :math:`\ell_4` norm
+        is computed.
+
+        :return: :math:`\ell_4` error using CIEDE2000
+        :rtype:  `float`
+
+        """
+        return self._norm(self._de2000_error, 4)
+
+    def de2000_inf(self):
+        """Compute :math:`\ell_\infty` error using CIEDE2000.
+
+        This method imports the images into Lab colour space, then calculates
+        the CIEDE2000 colour difference and returns the :math:`\ell_\infty`
+        norm.
+
+        See :eq:`de2000` for details on how the colour difference is computed,
+        and :eq:`l_inf` for details on how the standard :math:`\ell_\infty`
+        norm is computed.
+
+        :return: :math:`\ell_\infty` error using CIEDE2000
+        :rtype:  `float`
+
+        """
+        return self._norm(self._de2000_error, numpy.inf)
 
     def xyz_1(self):
         """Compute :math:`\ell_1` error in XYZ Colour Space.
@@ -459,9 +814,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        xyz1 = self.im1.icc_import(self.srgb_profile, self.intent).Lab2XYZ()
-        xyz2 = self.im2.icc_import(self.srgb_profile, self.intent).Lab2XYZ()
-        return xyz1.subtract(xyz2).abs().avg()
+        return self._norm(self._xyz_error, 1)
 
     def xyz_2(self):
         """Compute :math:`\ell_2` error in XYZ Colour Space.
@@ -476,9 +829,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        xyz1 = self.im1.icc_import(self.srgb_profile, self.intent).Lab2XYZ()
-        xyz2 = self.im2.icc_import(self.srgb_profile, self.intent).Lab2XYZ()
-        return xyz1.subtract(xyz2).pow(2).avg() ** 0.5
+        return self._norm(self._xyz_error, 2)
 
     def xyz_4(self):
         """Compute :math:`\ell_4` error in XYZ Colour Space.
@@ -493,9 +844,7 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        xyz1 = self.im1.icc_import(self.srgb_profile, self.intent).Lab2XYZ()
-        xyz2 = self.im2.icc_import(self.srgb_profile, self.intent).Lab2XYZ()
-        return xyz1.subtract(xyz2).pow(4).avg() ** 0.25
+        return self._norm(self._xyz_error, 4)
 
     def xyz_inf(self):
         """Compute :math:`\ell_\infty` error in XYZ Colour Space.
@@ -510,9 +859,827 @@ class Metrics(object):
         :rtype:  `float`
 
         """
-        xyz1 = self.im1.icc_import(self.srgb_profile, self.intent).Lab2XYZ()
-        xyz2 = self.im2.icc_import(self.srgb_profile, self.intent).Lab2XYZ()
-        return xyz1.subtract(xyz2).abs().max()
+        return self._norm(self._xyz_error, numpy.inf)
+
+    def estimate(self, name):
+        """Compute a metric and a 95% confidence interval for its result.
+
+        The interval is computed from the variance of the sampled blocks of
+        rows, so it only accounts for the sampling error. It is empty (both
+        bounds equal the result) when all rows are used. Metrics that combine
+        several norms, such as :meth:`ms_ssim`, have no interval in approximate
+        mode and `None` is returned for both bounds. The upper bound of an
+        :math:`\ell_\infty` metric is infinite, since the largest error may
+        not have been sampled.
+
+        :param name: the name or path of the metric (see :func:`load_metric`)
+        :type name:  `string`
+
+        :return:     the result and the lower and upper bounds
+        :rtype:      `tuple of floats`
+
+        """
+        self.bounds = []
+        result = load_metric(name)(self)
+        if len(self.bounds) != 1:
+            return result, None, None
+
+        # The bounds of the norm are scaled in the same way as the norm.
+        norm, low, high = self.bounds[0]
+        scale = result / norm if norm else 1
+        low, high = sorted([low * scale, high * scale])
+        return result, low, high
+
+    def save_map(self, name, path, dtype='float16'):
+        """Write a per-pixel map to a memory-mapped ``.npy`` file.
+
+        The following maps are available:
+
+            * `diff`: absolute sRGB differences of each channel, as a
+              percentage of the largest possible pixel value
+            * `cmc`: CMC(1:1) colour differences
+            * `ssim`: SSIM values (5 pixels are trimmed from each edge)
+
+        The strips are evaluated by the thread pool and written directly to
+        the file, so the complete map is never held in memory.
+
+        :param name:  name of the map
+        :param path:  file to write the map to
+        :param dtype: data type of the saved values (default='float16')
+        :type name:   `string`
+        :type path:   `path`
+        :type dtype:  `string`
+
+        """
+        error, border, scale = {
+            'diff': (self._srgb_error, 0, 100.0 / self.maxval),
+            'cmc': (self._cmc_error, 0, 1),
+            'ssim': (self._ssim_map, 5, 1)
+        }[name]
+        rows = self.planes1.rows() - 2 * border
+        shape = (rows,) + error(0, 1).shape[1:]
+        saved = numpy.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                             shape=shape)
+
+        def write(start, stop):
+            """Write the map of a single strip."""
+            saved[start:stop] = error(start, stop) * scale
+
+        self._map(write, rows)
+        saved.flush()
+
+    def sketch(self, family):
+        """Return a histogram of the per-pixel errors of a metric family.
+
+        The families are described in :mod:`sketch`. The strips are counted by
+        the thread pool and their counts are added.
+
+        :param family: name of the metric family
+        :type family:  `string`
+
+        :return:       the histogram
+        :rtype:        :class:`sketch.Sketch`
+
+        """
+        error, border, scale = {
+            'srgb': (self._srgb_error, 0, 100.0 / self.maxval),
+            'xyz': (self._xyz_error, 0, 1),
+            'cmc': (self._cmc_error, 0, 1),
+            'de2000': (self._de2000_error, 0, 1),
+            'blur': (self._blur_error, 5, 100.0 / self.maxval),
+            'ssim': (self._ssim_map, 5, 1)
+        }[family]
+        rows = self.planes1.rows() - 2 * border
+        return sketch.Sketch(family, numpy.sum(self._map(
+            lambda start, stop: sketch.count(error(start, stop) * scale,
+                                             family), rows
+        ), axis=0))
+
+    def _map(self, func, rows, strips=None):
+        """Private method to evaluate a function on horizontal strips.
+
+        By default, the rows are divided into strips of roughly equal height.
+        `func(start, stop)` is called for each strip using the thread pool.
+
+        .. note::
+
+            This is a private method called by :meth:`_norm`,
+            :meth:`_level_stats`, :meth:`save_map`, and :meth:`sketch`.
+
+        :param func:   function to evaluate on each strip
+        :param rows:   total number of rows
+        :param strips: (start, stop) rows of each strip (default: all rows)
+        :type func:    `function`
+        :type rows:    `integer`
+        :type strips:  `list of tuples`
+
+        :return:       results for each strip, from top to bottom
+        :rtype:        `list`
+
+        """
+        if strips is None:
+            count = min(rows, self.threads * _STRIPS_PER_THREAD)
+            bounds = numpy.linspace(0, rows, count + 1).astype(int)
+            strips = zip(bounds[:-1], bounds[1:])
+        if self.threads == 1:
+            return [func(start, stop) for start, stop in strips]
+        return _get_pool(self.threads).map(lambda strip: func(*strip), strips)
+
+    def _norm(self, error, power, border=0, level=0):
+        """Private method to compute a norm of per-pixel errors.
+
+        Each strip contributes the sum of its errors raised to `power` and the
+        number of errors, or its maximum error if `power` is infinite.
+
+        .. note::
+
+            This is a private method called by the :math:`\ell_p` metrics
+            and :meth:`reduce`.
+
+        :param error:  returns the errors for the rows in [start, stop)
+        :param power:  the norm to compute (1, 2, 4 or `numpy.inf`)
+        :param border: number of rows trimmed from the top and bottom
+        :param level:  pyramid level of the errors (0 is full size)
+        :type error:   `function`
+        :type power:   `number`
+        :type border:  `integer`
+        :type level:   `integer`
+
+        :return:       the norm of the errors
+        :rtype:        `float`
+
+        """
+        rows = (self.planes1.rows() >> level) - 2 * border
+        if self.sample < 1:
+            return self._sampled_norm(error, power, rows)
+        if power == numpy.inf:
+            return max(self._map(lambda start, stop:
+                                 error(start, stop).max(), rows))
+        total, count = numpy.sum(self._map(
+            lambda start, stop: _partial_sum(error(start, stop), power), rows
+        ), axis=0)
+        return (total / count) ** (1.0 / power)
+
+    def _sampled_norm(self, error, power, rows):
+        """Private method to estimate a norm from a sample of the rows.
+
+        The rows are divided into bands of equal height and a block of
+        consecutive rows is drawn at random from each band. The mean of the
+        errors raised to `power` is estimated from the block means, and its
+        standard error is used to compute a 95% confidence interval, which is
+        appended to :attr:`bounds` along with the estimate. The standard error
+        is computed from the spread of the block means across all bands, so
+        the interval is conservative when the errors vary across the image.
+
+        .. note::
+
+            This is a private method called by :meth:`_norm`.
+
+        :param error: returns the errors for the rows in [start, stop)
+        :param power: the norm to compute (any positive number or `numpy.inf`)
+        :param rows:  total number of rows
+        :type error:  `function`
+        :type power:  `number`
+        :type rows:   `integer`
+
+        :return:      the estimated norm of the errors
+        :rtype:       `float`
+
+        """
+        strata = min(rows, _STRATA)
+        bounds = numpy.linspace(0, rows, strata + 1).astype(int)
+        random = numpy.random.RandomState(self.seed)
+        strips = []
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            height = max(1, int(round((last - first) * self.sample)))
+            start = first + random.randint(0, last - first - height + 1)
+            strips.append((start, start + height))
+
+        if power == numpy.inf:
+            norm = max(self._map(lambda start, stop:
+                                 error(start, stop).max(), rows, strips))
+            self.bounds.append((norm, norm, numpy.inf))
+            return norm
+
+        # Each block estimates the mean of its band.
+        sums = numpy.array(self._map(lambda start, stop: _partial_sum(
+            error(start, stop), power), rows, strips))
+        weights = numpy.diff(bounds) / float(rows)
+        means = sums[:, 0] / sums[:, 1]
+        mean = numpy.dot(weights, means)
+        spread = numpy.std(means, ddof=1) if strata > 1 else 0
+        margin = _Z_95 * spread * numpy.sqrt(
+            numpy.dot(weights, weights) * (1 - self.sample))
+        if power == 1:
+            low, high = mean - margin, mean + margin
+        else:
+            low = max(mean - margin, 0) ** (1.0 / power)
+            high = (mean + margin) ** (1.0 / power)
+            mean **= 1.0 / power
+        self.bounds.append((mean, low, high))
+        return mean
+
+    def _mean(self, values, border=0, level=0):
+        """Private method to compute the mean of a per-pixel map.
+
+        .. note::
+
+            This is a private method called by :meth:`mssim`, :meth:`issim`,
+            and :meth:`ms_ssim`.
+
+        :param values: returns the map for the rows in [start, stop)
+        :param border: number of rows trimmed from the top and bottom
+        :param level:  pyramid level of the map (0 is full size)
+        :type values:  `function`
+        :type border:  `integer`
+        :type level:   `integer`
+
+        :return:       the mean of the map
+        :rtype:        `float`
+
+        """
+        return self._norm(values, 1, border, level)
+
+    def reduce(self, error, power, border=0, level=0):
+        """Compute a norm of per-pixel errors evaluated on horizontal strips.
+
+        This is the method used by the built-in :math:`\ell_p` metrics. It is
+        public so that metric plugins can be evaluated by the same thread
+        pool. A `power` of 1 computes the mean of a per-pixel map.
+
+        :param error:  returns the errors for the rows in [start, stop)
+        :param power:  the norm to compute (any positive number or
+                       `numpy.inf`)
+        :param border: number of rows trimmed from the top and bottom
+        :param level:  pyramid level of the errors (0 is full size)
+        :type error:   `function`
+        :type power:   `number`
+        :type border:  `integer`
+        :type level:   `integer`
+
+        :return:       the norm of the errors
+        :rtype:        `float`
+
+        """
+        return self._norm(error, power, border, level)
+
+    def _srgb_error(self, start, stop):
+        """Private method to return the absolute sRGB differences of a strip.
+
+        .. note::
+
+            This is a private method called by the sRGB metrics,
+            :meth:`save_map`, and :meth:`sketch`.
+
+        :param start: first row of the strip
+        :param stop:  row following the last row of the strip
+        :type start:  `integer`
+        :type stop:   `integer`
+
+        :return:      absolute differences
+        :rtype:       :class:`numpy.ndarray`
+
+        """
+        return numpy.abs(numpy.subtract(self.planes1.get('rgb')[start:stop],
+                                        self.planes2.get('rgb')[start:stop],
+                                        dtype=self.dtype))
+
+    def _xyz_error(self, start, stop):
+        """Private method to return the absolute XYZ differences of a strip.
+
+        .. note::
+
+            This is a private method called by the XYZ metrics and
+            :meth:`sketch`.
+
+        :param start: first row of the strip
+        :param stop:  row following the last row of the strip
+        :type start:  `integer`
+        :type stop:   `integer`
+
+        :return:      absolute differences
+        :rtype:       :class:`numpy.ndarray`
+
+        """
+        return numpy.abs(numpy.subtract(self.planes1.get('xyz')[start:stop],
+                                        self.planes2.get('xyz')[start:stop],
+                                        dtype=self.dtype))
+
+    def _cmc_error(self, start, stop):
+        """Private method to return the CMC(1:1) colour differences of a strip.
+
+        The colour difference is the Euclidean distance in the uniform colour
+        space used by VIPS to compute delta-E CMC(1:1).
+
+        .. note::
+
+            This is a private method called by the CMC metrics,
+            :meth:`save_map`, and :meth:`sketch`.
+
+        :param start: first row of the strip
+        :param stop:  row following the last row of the strip
+        :type start:  `integer`
+        :type stop:   `integer`
+
+        :return:      colour differences
+        :rtype:       :class:`numpy.ndarray`
+
+        """
+        diff = numpy.subtract(self.planes1.get('ucs')[start:stop],
+                              self.planes2.get('ucs')[start:stop],
+                              dtype=self.dtype)
+        return numpy.sqrt(numpy.sum(diff * diff, axis=2))
+
+    def _de2000_error(self, start, stop):
+        """Private method to return the CIEDE2000 differences of a strip.
+
+        .. note::
+
+            This is a private method called by the CIEDE2000 metrics and
+            :meth:`sketch`.
+
+        :param start: first row of the strip
+        :param stop:  row following the last row of the strip
+        :type start:  `integer`
+        :type stop:   `integer`
+
+        :return:      colour differences
+        :rtype:       :class:`numpy.ndarray`
+
+        """
+        return _ciede2000(self.planes1.get('lab', self.dtype)[start:stop],
+                          self.planes2.get('lab', self.dtype)[start:stop])
+
+    def _blur_error(self, start, stop):
+        """Private method to return the blurred grayscale differences.
+
+        The rows are indexed relative to the cropped image, so the strip reads
+        an extra 5 rows above and below to apply the Gaussian blur.
+
+        .. note::
+
+            This is a private method called by the MSSIM-inspired metrics
+            and :meth:`sketch`.
+
+        :param start: first row of the strip
+        :param stop:  row following the last row of the strip
+        :type start:  `integer`
+        :type stop:   `integer`
+
+        :return:      absolute differences
+        :rtype:       :class:`numpy.ndarray`
+
+        """
+        blur = _get_blurlist()
+        stop += len(blur) - 1
+        return numpy.abs(
+            _convsep(self.planes1.get('gray', self.dtype)[start:stop], blur) -
+            _convsep(self.planes2.get('gray', self.dtype)[start:stop], blur)
+        )
+
+    def _ssim_map(self, start, stop):
+        """Private method to return the SSIM map of a strip.
+
+        The rows are indexed relative to the cropped image, so the strip reads
+        an extra 5 rows above and below to apply the Gaussian blur.
+
+        .. note::
+
+            This is a private method called by :meth:`mssim`,
+            :meth:`save_map`, and :meth:`sketch`.
+
+        :param start: first row of the strip
+        :param stop:  row following the last row of the strip
+        :type start:  `integer`
+        :type stop:   `integer`
+
+        :return:      SSIM values
+        :rtype:       :class:`numpy.ndarray`
+
+        """
+        blur = _get_blurlist()
+        stop += len(blur) - 1
+        return self._ssim(self.planes1.get('gray', self.dtype)[start:stop],
+                          self.planes2.get('gray', self.dtype)[start:stop],
+                          lambda plane: _convsep(plane, blur))
+
+    def _issim_map(self, start, stop):
+        """Private method to return the integral-image SSIM map of a strip.
+
+        The rows are indexed relative to the cropped image, so the strip reads
+        extra rows above and below to apply the window.
+
+        .. note::
+
+            This is a private method called by :meth:`issim`.
+
+        :param start: first row of the strip
+        :param stop:  row following the last row of the strip
+        :type start:  `integer`
+        :type stop:   `integer`
+
+        :return:      SSIM values
+        :rtype:       :class:`numpy.ndarray`
+
+        """
+        widths = _get_box_widths(self.window, self.size)
+        stop += self.size - 1
+        return self._ssim(self.planes1.get('gray', self.dtype)[start:stop],
+                          self.planes2.get('gray', self.dtype)[start:stop],
+                          lambda plane: _boxes(plane, widths))
+
+    def _level_stats(self, planes, level):
+        """Private method to return the blurred statistics of a pyramid level.
+
+        The Gaussian blurred level and its blurred square are computed on
+        strips and cached by `planes`.
+
+        .. note::
+
+            This is a private method called by :meth:`ms_ssim` and
+            :meth:`_ms_ssim_map`.
+
+        :param planes: planes of the image
+        :param level:  pyramid level
+        :type planes:  :class:`Planes`
+        :type level:   `integer`
+
+        :return:       blurred level and blurred square of the level
+        :rtype:        `tuple`
+
+        """
+        def compute():
+            """Blur the level and its square on strips."""
+            blur = _get_blurlist()
+            plane = planes.get('pyramid', self.dtype)[level]
+            parts = self._map(lambda start, stop: (
+                _convsep(plane[start:stop + len(blur) - 1], blur),
+                _convsep(plane[start:stop + len(blur) - 1] ** 2, blur)
+            ), plane.shape[0] - len(blur) + 1)
+            return (numpy.concatenate([part[0] for part in parts]),
+                    numpy.concatenate([part[1] for part in parts]))
+        return planes.setdefault(('stats', level, self.dtype.str), compute)
+
+    def _ms_ssim_map(self, level, lum, start, stop):
+        """Private method to return an MS-SSIM map of a strip.
+
+        The rows are indexed relative to the cropped pyramid level, so the
+        strip reads an extra 5 rows above and below to apply the Gaussian blur.
+        Only the product of the two levels needs to be blurred, since the other
+        statistics are cached.
+
+        .. note::
+
+            This is a private method called by :meth:`ms_ssim`.
+
+        :param level: pyramid level
+        :param lum:   `True` if the luminance term should be included
+        :param start: first row of the strip
+        :param stop:  row following the last row of the strip
+        :type level:  `integer`
+        :type lum:    `boolean`
+        :type start:  `integer`
+        :type stop:   `integer`
+
+        :return:      contrast-structure or SSIM values
+        :rtype:       :class:`numpy.ndarray`
+
+        """
+        # Compute the SSIM constants from the highest possible pixel value.
+        const1 = (0.01 * self.maxval) ** 2
+        const2 = (0.03 * self.maxval) ** 2
+
+        # Get the cached statistics and blur the product of the levels.
+        blur = _get_blurlist()
+        mu1, sq1 = self._level_stats(self.planes1, level)
+        mu2, sq2 = self._level_stats(self.planes2, level)
+        mu1, sq1, mu2, sq2 = [stat[start:stop] for stat in mu1, sq1, mu2, sq2]
+        stop += len(blur) - 1
+        im1 = self.planes1.get('pyramid', self.dtype)[level][start:stop]
+        im2 = self.planes2.get('pyramid', self.dtype)[level][start:stop]
+        mu12 = mu1 * mu2
+
+        # Compute the contrast-structure map.
+        cs_map = ((2 * (_convsep(im1 * im2, blur) - mu12) + const2) /
+                  (sq1 - mu1 * mu1 + sq2 - mu2 * mu2 + const2))
+        if lum:
+            cs_map *= (2 * mu12 + const1) / (mu1 * mu1 + mu2 * mu2 + const1)
+        return cs_map
+
+    def _ssim(self, im1_g, im2_g, window):
+        """Private method to compute an SSIM map from grayscale rows.
+
+        .. note::
+
+            This is a private method called by :meth:`_ssim_map` and
+            :meth:`_issim_map`.
+
+        :param im1_g:  grayscale rows of the first image
+        :param im2_g:  grayscale rows of the second image
+        :param window: computes the weighted local means of a plane
+        :type im1_g:   :class:`numpy.ndarray`
+        :type im2_g:   :class:`numpy.ndarray`
+        :type window:  `function`
+
+        :return:       SSIM values
+        :rtype:        :class:`numpy.ndarray`
+
+        """
+        # Compute the SSIM constants from the highest possible pixel value.
+        const1 = (0.01 * self.maxval) ** 2
+        const_sum = const1 + (0.03 * self.maxval) ** 2
+
+        # Apply the window to the grayscale images.
+        im1_b = window(im1_g)
+        im2_b = window(im2_g)
+
+        # Compute the SSIM map.
+        tmp1 = 2 * window(im1_g * im2_g) + const_sum
+        tmp2 = window(im1_g * im1_g + im2_g * im2_g) + const_sum
+        tmp3 = 2 * im1_b * im2_b + const1
+        tmp4 = (im2_b - im1_b) ** 2 + tmp3
+        tmp5 = tmp3 * (tmp1 - tmp3)
+        return tmp5 / ((tmp2 - tmp4) * tmp4)
+
+
+class Engine(object):
+
+    """This class evaluates the metric commands of a project.
+
+    Commands that call :ref:`exquires-compare` are parsed and evaluated
+    in-process rather than in a subprocess. The :class:`Planes` of each image
+    are cached, so the decoded reference image and the data derived from it
+    (such as the MS-SSIM pyramid) are shared by the comparisons with every
+    upsampled image. Metric plugins are evaluated in the same way as the
+    built-in metrics. Any other command is executed in a subprocess and its
+    output is returned.
+
+    The planes of the master images can be shared through the scratch
+    directory with :meth:`share`, so they are decoded once and mapped into
+    memory by every process that uses them.
+
+    Commands using single precision are checked automatically. The first and
+    every `interval`-th result of each metric are recomputed in double
+    precision, and a warning is recorded in :attr:`warnings` if the relative
+    error exceeds `tolerance`.
+
+    .. warning::
+
+        An image must be released with :meth:`release` before it is removed
+        or overwritten, otherwise its cached planes will be used again.
+
+    An upsampled image written to standard output by a command is passed to
+    the engine with :meth:`run`, and one computed in-process with
+    :meth:`load`, so it does not need to be written to a file and decoded
+    again.
+
+    Commands can also be evaluated in approximate mode, either with the
+    :option:`--approximate` option of :ref:`exquires-compare` or for every
+    command with `sample`. The 95% confidence interval of the last result is
+    then available in :attr:`bounds`, which is `None` for exact results.
+
+    :param interval:  number of results between accuracy checks
+    :param tolerance: highest acceptable relative error
+    :param sample:    fraction of the rows to sample (default=1, exact)
+    :type interval:   `integer`
+    :type tolerance:  `float`
+    :type sample:     `float`
+
+    """
+
+    def __init__(self, interval=_CHECK_INTERVAL, tolerance=_CHECK_TOLERANCE,
+                 sample=1):
+        """Create a new :class:`Engine` object."""
+        self.parser = _get_parser()
+        self.planes = {}
+        self.interval = interval
+        self.tolerance = tolerance
+        self.sample = sample
+        self.counts = {}
+        self.warnings = []
+        self.bounds = None
+
+    def compare(self, command):
+        """Return the result of a metric command.
+
+        :param command: metric command with the replacement fields filled in
+        :type command:  `string`
+
+        :return:        the result of the metric
+        :rtype:         `float`
+
+        :raises:        :class:`ValueError` if the command cannot be parsed
+
+        """
+        self.bounds = None
+        cmd = command.split()
+        if os.path.basename(cmd[0]) != 'exquires-compare':
+            return float(check_output(cmd))
+
+        # Parse the arguments as they would be parsed by exquires-compare.
+        try:
+            args = self.parser.parse_args(cmd[1:])
+        except SystemExit:
+            raise ValueError(' '.join(['invalid metric command:', command]))
+        args.approximate = min(args.approximate, self.sample)
+
+        metric = Metrics(self.get_planes(args.image1),
+                         self.get_planes(args.image2), args.maxval,
+                         args.threads, args.window, args.size, args.precision,
+                         args.approximate, args.seed)
+        if args.approximate < 1:
+            result, low, high = metric.estimate(args.metric)
+            self.bounds = None if low is None else (low, high)
+        else:
+            result = load_metric(args.metric)(metric)
+        if metric.dtype != numpy.float64:
+            self._check(args, result)
+        return result
+
+    def _check(self, args, result):
+        """Private method to check the accuracy of a single precision result.
+
+        .. note::
+
+            This is a private method called by :meth:`compare`.
+
+        :param args:   parsed arguments of the metric command
+        :param result: the single precision result
+        :type args:    :class:`argparse.Namespace`
+        :type result:  `float`
+
+        """
+        count = self.counts.get(args.metric, 0)
+        self.counts[args.metric] = count + 1
+        if count % self.interval:
+            return
+
+        # Recompute the result in double precision.
+        metric = Metrics(self.get_planes(args.image1),
+                         self.get_planes(args.image2), args.maxval,
+                         args.threads, args.window, args.size,
+                         sample=args.approximate, seed=args.seed)
+        exact = load_metric(args.metric)(metric)
+        error = abs(result - exact) / abs(exact) if exact else abs(result)
+        if error > self.tolerance:
+            self.warnings.append(
+                'warning: {} has a relative error of {:.3g} in {} ({} vs {})'
+                .format(args.metric, error, args.precision, result, exact)
+            )
+
+    def save_maps(self, image1, image2, directory, dtype='float16'):
+        """Save the per-pixel maps of a comparison to a directory.
+
+        Each map in :data:`MAPS` is written to a file named after it (for
+        example, :file:`diff.npy`). The maps are computed in single precision
+        with as many threads as there are CPUs.
+
+        :param image1:    the reference image
+        :param image2:    the test image
+        :param directory: directory to write the maps to
+        :param dtype:     data type of the saved values (default='float16')
+        :type image1:     `path`
+        :type image2:     `path`
+        :type directory:  `path`
+        :type dtype:      `string`
+
+        """
+        metric = Metrics(self.get_planes(image1), self.get_planes(image2),
+                         threads=cpu_count(), precision='float32')
+        for name in MAPS:
+            metric.save_map(name, os.path.join(directory, name + '.npy'),
+                            dtype)
+
+    def sketch(self, image1, image2, family):
+        """Return a histogram of the per-pixel errors of a comparison.
+
+        :param image1: the reference image
+        :param image2: the test image
+        :param family: name of the metric family (see :mod:`sketch`)
+        :type image1:  `path`
+        :type image2:  `path`
+        :type family:  `string`
+
+        :return:       the histogram
+        :rtype:        :class:`sketch.Sketch`
+
+        """
+        metric = Metrics(self.get_planes(image1), self.get_planes(image2),
+                         threads=cpu_count(), precision='float32')
+        return metric.sketch(family)
+
+    def run(self, command, image, size, write=False):
+        """Run a command that writes an image to standard output.
+
+        A TIFF image is written to the given path if it has a TIFF extension.
+        Otherwise, the TIFF image is decoded, and any other output is read as
+        raw 16-bit (big-endian) or 8-bit RGB samples of a square image, as
+        written by ImageMagick with `-depth 16 -endian MSB rgb:-`. The planes
+        of such an image are cached under the given path, which is only
+        written to (in the format given by its extension) if requested, for
+        metric commands that run in a subprocess.
+
+        :param command: the command with the replacement fields filled in
+        :param image:   path under which to cache or write the image
+        :param size:    width and height of the image
+        :param write:   `True` if a decoded image must also be written to
+                        `image`
+        :type command:  `string`
+        :type image:    `path`
+        :type size:     `integer`
+        :type write:    `boolean`
+
+        :return:        digest of the output
+        :rtype:         `string`
+
+        :raises:        :class:`ValueError` if the output has the wrong size
+
+        """
+        data = check_output(command.split())
+        if data[:4] not in _TIFF_MAGIC:
+            self.load(image, _from_raw(data, size), write)
+        elif os.path.splitext(image)[1].lower() in ('.tif', '.tiff'):
+            with open(image, 'wb') as tiff:
+                tiff.write(data)
+        else:
+            # Decode the TIFF image from a temporary file.
+            handle, temp = tempfile.mkstemp(
+                '.tif', dir=os.path.dirname(os.path.abspath(image)))
+            try:
+                with os.fdopen(handle, 'wb') as tiff:
+                    tiff.write(data)
+                pixels = numpy.array(Planes(temp).get('rgb'))
+            finally:
+                os.remove(temp)
+            self.load(image, pixels, write)
+        return hashlib.sha1(data).hexdigest()
+
+    def load(self, image, pixels, write=False):
+        """Cache the planes of an image given by its pixels.
+
+        :param image:  path under which to cache the image
+        :param pixels: sRGB pixels (height x width x 3)
+        :param write:  `True` if the image must also be written to `image`
+        :type image:   `path`
+        :type pixels:  :class:`numpy.ndarray`
+        :type write:   `boolean`
+
+        """
+        self.planes[image] = Planes(image, pixels)
+        if write and os.path.splitext(image)[1] == '.npy':
+            numpy.save(image, pixels)
+        elif write:
+            self.planes[image].vimage.write(image)
+
+    def digest(self, image):
+        """Return the digest of the pixels of an image.
+
+        :param image: the image
+        :type image:  `path`
+
+        :return:      the SHA-1 digest of the decoded pixels
+        :rtype:       `string`
+
+        """
+        pixels = numpy.ascontiguousarray(self.get_planes(image).get('rgb'))
+        return hashlib.sha1(pixels.tostring()).hexdigest()
+
+    def share(self, image, directory):
+        """Share the planes of an image through a directory.
+
+        The planes are decoded or derived once, saved to the directory, and
+        mapped into memory read-only (see :class:`Planes`).
+
+        :param image:     the image
+        :param directory: directory to share the planes through
+        :type image:      `path`
+        :type directory:  `path`
+
+        """
+        self.planes[image] = Planes(image, directory=directory)
+
+    def get_planes(self, image):
+        """Return the cached planes of an image, creating them if necessary.
+
+        :param image: the image
+        :type image:  `path`
+
+        :return:      the planes of the image
+        :rtype:       :class:`Planes`
+
+        """
+        if image not in self.planes:
+            self.planes[image] = Planes(image)
+        return self.planes[image]
+
+    def release(self, image):
+        """Discard the cached planes of an image.
+
+        :param image: the image
+        :type image:  `path`
+
+        """
+        self.planes.pop(image, None)
 
 
 def _get_blurlist():
@@ -550,18 +1717,382 @@ def _get_blurlist():
             blur0, blur1, blur2, blur3, blur4, blur5]
 
 
-def main():
-    """Run :ref:`exquires-compare`."""
+def _to_array(vimage):
+    """Private method to copy the pixels of a VIPS image into a NumPy array.
+
+    .. note::
+
+        This is a private function called by :class:`Planes`.
+
+    :param vimage: image to copy
+    :type vimage:  :class:`vipsCC.VImage.VImage`
+
+    :return:       pixels (height x width x bands)
+    :rtype:        :class:`numpy.ndarray`
+
+    """
+    pixels = numpy.frombuffer(vimage.tobuffer(),
+                              dtype=_BANDFMT[vimage.BandFmt()])
+    return pixels.reshape(vimage.Ysize(), vimage.Xsize(), vimage.Bands())
+
+
+def _from_raw(data, size):
+    """Private function to convert raw RGB samples into a NumPy array.
+
+    .. note::
+
+        This is a private function called by :meth:`Engine.run`.
+
+    :param data: 16-bit (big-endian) or 8-bit samples
+    :param size: width and height of the image
+    :type data:  `string`
+    :type size:  `integer`
+
+    :return:     pixels (size x size x 3)
+    :rtype:      :class:`numpy.ndarray`
+
+    :raises:     :class:`ValueError` if the data has the wrong size
+
+    """
+    samples = size * size * 3
+    if len(data) == 2 * samples:
+        dtype = numpy.dtype('>u2')
+    elif len(data) == samples:
+        dtype = numpy.dtype(numpy.uint8)
+    else:
+        raise ValueError('unexpected image size: {} bytes'.format(len(data)))
+    pixels = numpy.frombuffer(data, dtype).astype(dtype.type)
+    return pixels.reshape(size, size, 3)
+
+
+def _astype(plane, dtype):
+    """Private method to convert a plane, or a list of planes, to a data type.
+
+    .. note::
+
+        This is a private function called by :meth:`Planes.get`.
+
+    :param plane: plane or list of planes (such as a pyramid) to convert
+    :param dtype: data type to convert to
+    :type plane:  :class:`numpy.ndarray` or `list`
+    :type dtype:  :class:`numpy.dtype`
+
+    :return:      the converted plane or list of planes
+
+    """
+    if isinstance(plane, list):
+        return [_astype(level, dtype) for level in plane]
+    return plane.astype(dtype, copy=False)
 
-    # Obtain a list of error metrics that can be called.
-    metrics = []
-    methods = inspect.getmembers(Metrics, predicate=inspect.ismethod)
-    for method in methods[1:]:
-        metrics.append(method[0])
 
+def _partial_sum(values, power):
+    """Private method to return the sum of powers and the number of values.
+
+    .. note::
+
+        This is a private function called by :meth:`Metrics._norm`.
+
+    :param values: values to sum
+    :param power:  power to raise the values to
+    :type values:  :class:`numpy.ndarray`
+    :type power:   `integer`
+
+    :return:       sum of the powers and number of values
+    :rtype:        `tuple`
+
+    """
+    if power == 1:
+        return numpy.sum(values, dtype=numpy.float64), values.size
+    return numpy.sum(values ** power, dtype=numpy.float64), values.size
+
+
+def _convsep(plane, mask):
+    """Private method to apply a separable convolution to a plane.
+
+    Only the pixels for which the mask fits entirely inside the plane are
+    returned, so the result is smaller than the plane by one less than the
+    length of the mask in each direction.
+
+    .. note::
+
+        This is a private function called by :meth:`Metrics._blur_error` and
+        :meth:`Metrics._ssim_map`.
+
+    :param plane: plane to convolve
+    :param mask:  one-dimensional convolution mask
+    :type plane:  :class:`numpy.ndarray`
+    :type mask:   `list of floats`
+
+    :return:      the convolved plane
+    :rtype:       :class:`numpy.ndarray`
+
+    """
+    rows = plane.shape[0] - len(mask) + 1
+    cols = plane.shape[1] - len(mask) + 1
+
+    # Convolve the columns.
+    tmp = mask[0] * plane[:rows]
+    for i, coeff in enumerate(mask[1:], 1):
+        tmp += coeff * plane[i:i + rows]
+
+    # Convolve the rows.
+    result = mask[0] * tmp[:, :cols]
+    for i, coeff in enumerate(mask[1:], 1):
+        result += coeff * tmp[:, i:i + cols]
+    return result
+
+
+def _ciede2000(lab1, lab2):
+    """Private method to compute the CIEDE2000 colour differences.
+
+    The computation follows Sharma, Wu, and Dalal, "The CIEDE2000
+    Color-Difference Formula: Implementation Notes, Supplementary Test Data,
+    and Mathematical Observations", with every step applied to whole arrays.
+    The differences have the same data type as the Lab pixels.
+
+    .. note::
+
+        This is a private function called by :meth:`Metrics._de2000_error`.
+
+    :param lab1: first set of Lab pixels (height x width x 3)
+    :param lab2: second set of Lab pixels (height x width x 3)
+    :type lab1:  :class:`numpy.ndarray`
+    :type lab2:  :class:`numpy.ndarray`
+
+    :return:     colour differences (height x width)
+    :rtype:      :class:`numpy.ndarray`
+
+    """
+    l_1, a_1, b_1 = [lab1[..., i] for i in range(3)]
+    l_2, a_2, b_2 = [lab2[..., i] for i in range(3)]
+
+    # Adjust the a* axis to compensate for the chroma of neutral colours.
+    c_bar7 = ((numpy.hypot(a_1, b_1) + numpy.hypot(a_2, b_2)) / 2) ** 7
+    g_fac = 1.5 - 0.5 * numpy.sqrt(c_bar7 / (c_bar7 + 25.0 ** 7))
+    a_1 = a_1 * g_fac
+    a_2 = a_2 * g_fac
+
+    # Compute the chroma and hue (in degrees) using the adjusted a* axis.
+    c_1 = numpy.hypot(a_1, b_1)
+    c_2 = numpy.hypot(a_2, b_2)
+    h_1 = numpy.degrees(numpy.arctan2(b_1, a_1)) % 360
+    h_2 = numpy.degrees(numpy.arctan2(b_2, a_2)) % 360
+    c_prod = c_1 * c_2
+    neutral = c_prod == 0
+
+    # Compute the hue difference, wrapping it into [-180, 180].
+    dh = h_2 - h_1
+    dh = numpy.where(dh > 180, dh - 360, numpy.where(dh < -180, dh + 360, dh))
+    dh[neutral] = 0
+    dh_big = 2 * numpy.sqrt(c_prod) * numpy.sin(numpy.radians(dh / 2))
+
+    # Compute the mean hue, which is undefined for neutral colours.
+    h_bar = h_1 + h_2
+    h_bar = numpy.where(numpy.abs(h_1 - h_2) <= 180, h_bar / 2,
+                        numpy.where(h_bar < 360, (h_bar + 360) / 2,
+                                    (h_bar - 360) / 2))
+    h_bar = numpy.where(neutral, h_1 + h_2, h_bar)
+
+    # Compute the weighting functions.
+    l_bar50 = ((l_1 + l_2) / 2 - 50) ** 2
+    c_bar = (c_1 + c_2) / 2
+    c_bar7 = c_bar ** 7
+    t_fac = (1 - 0.17 * numpy.cos(numpy.radians(h_bar - 30)) +
+             0.24 * numpy.cos(numpy.radians(2 * h_bar)) +
+             0.32 * numpy.cos(numpy.radians(3 * h_bar + 6)) -
+             0.20 * numpy.cos(numpy.radians(4 * h_bar - 63)))
+    s_l = 1 + 0.015 * l_bar50 / numpy.sqrt(20 + l_bar50)
+    s_c = 1 + 0.045 * c_bar
+    s_h = 1 + 0.015 * c_bar * t_fac
+    d_theta = 30 * numpy.exp(-((h_bar - 275) / 25) ** 2)
+    r_t = (-2 * numpy.sqrt(c_bar7 / (c_bar7 + 25.0 ** 7)) *
+           numpy.sin(numpy.radians(2 * d_theta)))
+
+    # Combine the weighted lightness, chroma, and hue differences.
+    d_l = (l_2 - l_1) / s_l
+    d_c = (c_2 - c_1) / s_c
+    d_h = dh_big / s_h
+    return numpy.sqrt(d_l * d_l + d_c * d_c + d_h * d_h + r_t * d_c * d_h)
+
+
+def _get_box_widths(window, size):
+    """Private method to return the box widths that make up a window.
+
+    A box window is a single box filter. A Gaussian window is approximated by
+    three successive box filters whose combined support is `size` pixels.
+
+    .. note::
+
+        This is a private function called by :meth:`Metrics._issim_map`.
+
+    :param window: shape of the window (`box` or `gaussian`)
+    :param size:   width and height of the window
+    :type window:  `string`
+    :type size:    `integer`
+
+    :return:       widths of the box filters
+    :rtype:        `list of integers`
+
+    """
+    if window == 'box':
+        return [size]
+    base, extra = divmod(size + 2, 3)
+    return [base + 1 if i < extra else base for i in range(3)]
+
+
+def _boxes(plane, widths):
+    """Private method to apply successive box filters using integral images.
+
+    Each box filter is computed from a summed-area table, so the cost per
+    pixel does not depend on the width of the box. Only the pixels for which
+    the boxes fit entirely inside the plane are returned.
+
+    .. note::
+
+        This is a private function called by :meth:`Metrics._issim_map`.
+
+    :param plane:  plane to filter
+    :param widths: widths of the box filters
+    :type plane:   :class:`numpy.ndarray`
+    :type widths:  `list of integers`
+
+    :return:       the filtered plane
+    :rtype:        :class:`numpy.ndarray`
+
+    """
+    for width in widths:
+        # Compute the summed-area table, padded with a row and column of 0s.
+        # The table is accumulated in double precision to avoid cancellation.
+        table = numpy.zeros((plane.shape[0] + 1, plane.shape[1] + 1))
+        numpy.cumsum(plane, axis=0, out=table[1:, 1:])
+        numpy.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+
+        # Each box sum is obtained from the four corners of the box.
+        dtype = plane.dtype
+        plane = (table[width:, width:] - table[:-width, width:] -
+                 table[width:, :-width] + table[:-width, :-width])
+        plane = (plane / (width * width)).astype(dtype)
+    return plane
+
+
+def get_metrics():
+    """Return the names of the metrics that can be called by name.
+
+    These are the public methods of :class:`Metrics` and the plugins
+    registered under the ``exquires.metrics`` entry point group. Plugins that
+    are not registered can still be called by their `module:function` path.
+
+    :return: the source of each metric, keyed by name
+    :rtype:  `dict`
+
+    """
+    metrics = {}
+    for name, method in inspect.getmembers(Metrics, inspect.ismethod):
+        if not name.startswith('_') and \
+                inspect.getargspec(method).args == ['self']:
+            metrics[name] = 'built-in'
+    for name, entry_point in _get_entry_points().items():
+        metrics.setdefault(name, ':'.join([entry_point.module_name,
+                                           '.'.join(entry_point.attrs)]))
+    return metrics
+
+
+def load_metric(name):
+    """Return the function that computes a metric.
+
+    A metric is either the name of a built-in metric, the name of a plugin
+    registered under the ``exquires.metrics`` entry point group, or the path
+    of a function given as `module:function`. The function is called with a
+    :class:`Metrics` object and must return the result as a `float`.
+
+    :param name: the name or path of the metric
+    :type name:  `string`
+
+    :return:     the metric function
+    :rtype:      `function`
+
+    :raises:     :class:`ValueError` if the metric cannot be loaded
+
+    """
+    if name in _LOADED:
+        return _LOADED[name]
+
+    # Built-in metrics take precedence over plugins with the same name.
+    try:
+        if get_metrics().get(name) == 'built-in':
+            func = getattr(Metrics, name)
+        elif ':' in name:
+            module, attr = name.split(':', 1)
+            func = __import__(module, globals(), locals(), [attr], 0)
+            for part in attr.split('.'):
+                func = getattr(func, part)
+        else:
+            entry_point = _get_entry_points().get(name)
+            if entry_point is None:
+                raise ValueError(' '.join(['unknown metric:', name]))
+            func = entry_point.load()
+    except (ImportError, AttributeError), error:
+        raise ValueError('cannot load metric {}: {}'.format(name, error))
+    if not callable(func):
+        raise ValueError(' '.join(['metric is not callable:', name]))
+    _LOADED[name] = func
+    return func
+
+
+def _get_entry_points():
+    """Private method to return the metric plugins registered with setuptools.
+
+    .. note::
+
+        This is a private function called by :func:`get_metrics` and
+        :func:`load_metric`.
+
+    :return: the entry points, keyed by name (empty if setuptools is missing)
+    :rtype:  `dict`
+
+    """
+    try:
+        pkg_resources = __import__('pkg_resources')
+    except ImportError:
+        return {}
+    return dict((entry_point.name, entry_point) for entry_point in
+                pkg_resources.iter_entry_points(_ENTRY_POINT_GROUP))
+
+
+def _get_pool(threads):
+    """Private method to return a shared pool with the specified size.
+
+    .. note::
+
+        This is a private function called by :meth:`Metrics._map`.
+
+    :param threads: number of threads in the pool
+    :type threads:  `integer`
+
+    :return:        the thread pool
+    :rtype:         :class:`multiprocessing.pool.ThreadPool`
+
+    """
+    if threads not in _POOLS:
+        _POOLS[threads] = ThreadPool(threads)
+    return _POOLS[threads]
+
+
+def _get_parser():
+    """Private method to return the argument parser of exquires-compare.
+
+    .. note::
+
+        This is a private function called by :class:`Engine` and
+        :func:`main`.
+
+    :return: the argument parser
+    :rtype:  :class:`parsing.ExquiresParser`
+
+    """
     # Define the command-line argument parser.
     parser = parsing.ExquiresParser(description=__doc__)
-    parser.add_argument('metric', type=str, metavar='METRIC', choices=metrics,
+    parser.add_argument('metric', type=_metric_name, metavar='METRIC',
                         help='the difference metric to use')
     parser.add_argument('image1', type=str, metavar='IMAGE_1',
                         help='the first image to compare')
@@ -570,16 +2101,151 @@ def main():
     parser.add_argument('-m', '--maxval', type=int, metavar='MAX_LEVEL',
                         default=65535,
                         help='the maximum pixel value (default: 65535)')
+    parser.add_argument('-t', '--threads', type=int, metavar='THREADS',
+                        default=cpu_count(),
+                        help='number of threads (default: number of CPUs)')
+    parser.add_argument('-w', '--window', type=str, metavar='WINDOW',
+                        choices=['box', 'gaussian'], default='gaussian',
+                        help='issim window shape (default: gaussian)')
+    parser.add_argument('-s', '--size', type=_window_size, metavar='SIZE',
+                        default=11,
+                        help='issim window size, odd (default: 11)')
+    parser.add_argument('-P', '--precision', type=str, metavar='PRECISION',
+                        choices=['float32', 'float64'], default='float64',
+                        help='precision of intermediates (default: float64)')
+    parser.add_argument('-a', '--approximate', type=_fraction,
+                        metavar='FRACTION', default=1,
+                        help='sample this fraction of the rows (default: 1)')
+    parser.add_argument('-S', '--seed', type=int, metavar='SEED', default=0,
+                        help='seed used to sample the rows (default: 0)')
+    parser.add_argument('-l', '--list', action=_ListAction,
+                        help='list the available metrics and exit')
+    return parser
+
+
+def _metric_name(value):
+    """Private method to parse the name of a metric.
+
+    .. note::
+
+        This is a private function called by :func:`_get_parser`.
+
+    :param value: the metric given on the command line
+    :type value:  `string`
+
+    :return:      the metric
+    :rtype:       `string`
+
+    :raises:      :class:`argparse.ArgumentTypeError`
+
+    """
+    try:
+        load_metric(value)
+    except ValueError, error:
+        raise argparse.ArgumentTypeError(str(error))
+    return value
+
+
+def _fraction(value):
+    """Private method to parse the fraction of the rows to sample.
+
+    .. note::
+
+        This is a private function called by :func:`_get_parser`.
+
+    :param value: the fraction given on the command line
+    :type value:  `string`
+
+    :return:      the fraction
+    :rtype:       `float`
+
+    :raises:      :class:`argparse.ArgumentTypeError`
+
+    """
+    fraction = float(value)
+    if not 0 < fraction <= 1:
+        msg = 'the fraction must be greater than 0 and at most 1'
+        raise argparse.ArgumentTypeError(msg)
+    return fraction
+
+
+def _window_size(value):
+    """Private method to parse the size of the :meth:`Metrics.issim` window.
+
+    .. note::
+
+        This is a private function called by :func:`_get_parser`.
+
+    :param value: the size given on the command line
+    :type value:  `string`
+
+    :return:      the size
+    :rtype:       `integer`
+
+    :raises:      :class:`argparse.ArgumentTypeError`
+
+    """
+    size = int(value)
+    if size < 1 or not size % 2:
+        msg = 'the window size must be a positive odd integer'
+        raise argparse.ArgumentTypeError(msg)
+    return size
+
+
+class _ListAction(argparse.Action):
+
+    """Parser action to list the available metrics and exit."""
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS,
+                 default=argparse.SUPPRESS, help=None):
+        """Create a new :class:`_ListAction` object."""
+        super(_ListAction, self).__init__(option_strings=option_strings,
+                                          dest=dest, default=default,
+                                          nargs=0, help=help)
+
+    def __call__(self, parser, args, values, option_string=None):
+        """Print the name and source of each metric.
+
+        :param parser:        the parser calling this action
+        :param args:          arguments
+        :param values:        values
+        :param option_string: command-line option string
+        :type parser:         :class:`parsing.ExquiresParser`
+        :type args:           :class:`argparse.Namespace`
+        :type values:         `list of values`
+        :type option_string:  `string`
+
+        """
+        for name, source in sorted(get_metrics().items()):
+            print '{:<16}{}'.format(name, source)
+        parser.exit()
+
+
+def main():
+    """Run :ref:`exquires-compare`."""
 
     # Attempt to parse the command-line arguments.
+    parser = _get_parser()
     args = parser.parse_args()
 
     # Attempt to call the chosen metric on the specified images.
     vipscc = __import__('vipsCC', globals(), locals(), ['VError'], -1)
     try:
         # Print the result with 15 digits after the decimal.
-        metric = Metrics(args.image1, args.image2, args.maxval)
-        print '%.15f' % getattr(metric, args.metric)()
+        metric = Metrics(args.image1, args.image2, args.maxval, args.threads,
+                         args.window, args.size, args.precision,
+                         args.approximate, args.seed)
+        if args.approximate < 1:
+            # Print the confidence interval on a separate stream.
+            result, low, high = metric.estimate(args.metric)
+            print '%.15f' % result
+            if low is None:
+                print >> sys.stderr, 'no confidence interval for this metric'
+            else:
+                print >> sys.stderr, ('95%% confidence interval:'
+                                      ' [%.15f, %.15f]' % (low, high))
+        else:
+            print '%.15f' % load_metric(args.metric)(metric)
     except vipscc.VError.VError, error:
         parser.error(str(error))
 
@@ -80,6 +80,10 @@ def _get_group_and_ranks(args):
     # Open the database connection.
     dbase = database.Database(args.dbase_file)
 
+    # Omit upsamplers dropped by successive halving before these tables.
+    complete = dbase.get_upsamplers(dbase.get_tables(args))
+    args.up = [upsampler for upsampler in args.up if upsampler in complete]
+
     # Determine which cross-correlation to perform.
     group = getattr(args, args.key)
     ranks = []
@@ -13,6 +13,8 @@
 
 import sqlite3
 
+from exquires import sketch
+
 
 class Database:
 
@@ -22,6 +24,20 @@ class Database:
     :ref:`exquires-update`. This data is retrieved and used to compute the
     output given by :ref:`exquires-report` and :ref:`exquires-correlate`.
 
+    The SKETCHES table stores optional histograms of the per-pixel errors of
+    each comparison (see :mod:`sketch`), keyed by table name, upsampler, and
+    metric family.
+
+    The INTERVALS table stores the 95% confidence intervals of the results
+    computed in approximate mode, keyed by table name, upsampler, and metric.
+
+    The PRUNED table stores the upsamplers dropped by successive halving, along
+    with the number of images they were evaluated on before being dropped.
+
+    The POINTS table caches the aggregated results computed by
+    :ref:`exquires-search`, keyed by upsampler command, metric, and inputs.
+    It is only created in the database used by :ref:`exquires-search`.
+
     :param dbasefile: database file to connect to
     :type dbasefile:  `path`
 
@@ -35,6 +51,14 @@ class Database:
         self.dbase.text_factory = str
         self.sql_do('CREATE TABLE IF NOT EXISTS TABLEDATA (name TEXT PRIMARY'
                     ' KEY, image TEXT, downsampler TEXT, ratio TEXT )')
+        self.sql_do('CREATE TABLE IF NOT EXISTS SKETCHES (name TEXT,'
+                    ' upsampler TEXT, family TEXT, counts BLOB,'
+                    ' PRIMARY KEY (name, upsampler, family) )')
+        self.sql_do('CREATE TABLE IF NOT EXISTS INTERVALS (name TEXT,'
+                    ' upsampler TEXT, metric TEXT, low DOUBLE, high DOUBLE,'
+                    ' PRIMARY KEY (name, upsampler, metric) )')
+        self.sql_do('CREATE TABLE IF NOT EXISTS PRUNED (upsampler TEXT'
+                    ' PRIMARY KEY, images INTEGER )')
 
     def sql_do(self, sql, params=()):
         """Perform an operation on the database and commit the changes.
@@ -203,6 +227,10 @@ class Database:
             # Delete the rows from TABLEDATA and drop the tables by name.
             self.dbase.executemany('DELETE FROM TABLEDATA WHERE name = ?',
                                    names)
+            self.dbase.executemany('DELETE FROM SKETCHES WHERE name = ?',
+                                   names)
+            self.dbase.executemany('DELETE FROM INTERVALS WHERE name = ?',
+                                   names)
             for name in names:
                 self.dbase.execute(' '.join(['DROP TABLE', name[0]]))
             self.dbase.commit()
@@ -273,6 +301,210 @@ class Database:
         self.dbase.execute(query, [upsampler])
         self.dbase.commit()
 
+    def copy_rows(self, source, table, metrics):
+        """Copy all rows of a table into another table.
+
+        The histograms and confidence intervals of the copied rows are copied
+        as well.
+
+        :param source:  name of the table to copy from
+        :param table:   name of the table to copy to
+        :param metrics: error metrics (columns) to copy
+        :type source:   `string`
+        :type table:    `string`
+        :type metrics:  `list of strings`
+
+        """
+        columns = ','.join(['upsampler'] + list(metrics))
+        self.dbase.execute('INSERT OR REPLACE INTO {} ({}) SELECT {} FROM {}'
+                           .format(table, columns, columns, source))
+        self.dbase.execute('INSERT OR REPLACE INTO SKETCHES SELECT ?,'
+                           ' upsampler, family, counts FROM SKETCHES'
+                           ' WHERE name = ?', [table, source])
+        self.dbase.execute('INSERT OR REPLACE INTO INTERVALS SELECT ?,'
+                           ' upsampler, metric, low, high FROM INTERVALS'
+                           ' WHERE name = ?', [table, source])
+        self.dbase.commit()
+
+    def insert_sketch(self, table, upsampler, error_sketch):
+        """Insert the histogram of a comparison, or update if it exists.
+
+        :param table:        name of the table of the comparison
+        :param upsampler:    name of the upsampler of the comparison
+        :param error_sketch: histogram of the per-pixel errors
+        :type table:         `string`
+        :type upsampler:     `string`
+        :type error_sketch:  :class:`sketch.Sketch`
+
+        """
+        self.insert('SKETCHES', dict(name=table, upsampler=upsampler,
+                                     family=error_sketch.family,
+                                     counts=error_sketch.to_blob()))
+
+    def get_sketch(self, tables, upsampler, family):
+        """Return the merged histogram of several comparisons.
+
+        Comparisons without a histogram for this family are ignored.
+
+        :param tables:    names of the tables to merge across
+        :param upsampler: name of the upsampler
+        :param family:    name of the metric family
+        :type tables:     `list of strings`
+        :type upsampler:  `string`
+        :type family:     `string`
+
+        :return:          the merged histogram
+        :rtype:           :class:`sketch.Sketch`
+
+        """
+        merged = sketch.Sketch(family)
+        query = ('SELECT name, counts FROM SKETCHES'
+                 ' WHERE upsampler = ? AND family = ?')
+        selected = set(tables)
+        for row in self.sql_fetchall(query, [upsampler, family]):
+            if row[0] in selected:
+                merged += sketch.Sketch.from_blob(family, row[1])
+        return merged
+
+    def insert_interval(self, table, upsampler, metric, bounds):
+        """Insert the confidence interval of a result, or update if it exists.
+
+        :param table:     name of the table of the result
+        :param upsampler: name of the upsampler (row) of the result
+        :param metric:    name of the metric (column) of the result
+        :param bounds:    lower and upper bounds of the interval
+        :type table:      `string`
+        :type upsampler:  `string`
+        :type metric:     `string`
+        :type bounds:     `tuple of floats`
+
+        """
+        self.insert('INTERVALS', dict(name=table, upsampler=upsampler,
+                                      metric=metric, low=bounds[0],
+                                      high=bounds[1]))
+
+    def delete_intervals(self, table, upsampler, metrics):
+        """Delete the confidence intervals of some metrics of a row.
+
+        :param table:     name of the table
+        :param upsampler: name of the upsampler (row)
+        :param metrics:   names of the metrics
+        :type table:      `string`
+        :type upsampler:  `string`
+        :type metrics:    `list of strings`
+
+        """
+        self.dbase.executemany('DELETE FROM INTERVALS WHERE name = ? AND'
+                               ' upsampler = ? AND metric = ?',
+                               [(table, upsampler, metric)
+                                for metric in metrics])
+        self.dbase.commit()
+
+    def get_intervals(self, table, upsampler):
+        """Return the confidence intervals of the approximate results of a row.
+
+        :param table:     name of the table
+        :param upsampler: name of the upsampler (row)
+        :type table:      `string`
+        :type upsampler:  `string`
+
+        :return:          lower and upper bounds, keyed by metric
+        :rtype:           `dict`
+
+        """
+        query = ('SELECT metric, low, high FROM INTERVALS'
+                 ' WHERE name = ? AND upsampler = ?')
+        return dict((row[0], (row[1], row[2])) for row in
+                    self.sql_fetchall(query, [table, upsampler]))
+
+    def get_upsamplers(self, tables):
+        """Return the upsamplers that have a row in every one of the tables.
+
+        :param tables: names of the tables
+        :type tables:  `list of strings`
+
+        :return:       names of the upsamplers
+        :rtype:        `set of strings`
+
+        """
+        upsamplers = None
+        for table in tables:
+            query = 'SELECT upsampler FROM {}'.format(table)
+            rows = set(row[0] for row in self.sql_fetchall(query))
+            upsamplers = rows if upsamplers is None else upsamplers & rows
+        return upsamplers or set()
+
+    def insert_pruned(self, upsampler, images):
+        """Record that an upsampler was dropped by successive halving.
+
+        :param upsampler: name of the upsampler
+        :param images:    number of images the upsampler was evaluated on
+        :type upsampler:  `string`
+        :type images:     `integer`
+
+        """
+        self.insert('PRUNED', dict(upsampler=upsampler, images=images))
+
+    def get_pruned(self):
+        """Return the upsamplers dropped by successive halving.
+
+        :return: number of images evaluated, keyed by upsampler
+        :rtype:  `dict`
+
+        """
+        return dict((row[0], row[1]) for row in
+                    self.sql_fetchall('SELECT upsampler, images FROM PRUNED'))
+
+    def __create_points(self):
+        """Private method to create the POINTS table if it does not exist.
+
+        .. note::
+
+            This is a private method called by :meth:`insert_point` and
+            :meth:`get_point`.
+
+        """
+        self.sql_do('CREATE TABLE IF NOT EXISTS POINTS (command TEXT,'
+                    ' metric TEXT, inputs TEXT, result DOUBLE,'
+                    ' PRIMARY KEY (command, metric, inputs) )')
+
+    def insert_point(self, command, metric, inputs, result):
+        """Cache the aggregated result of an upsampler command.
+
+        :param command: upsampler command
+        :param metric:  name of the metric
+        :param inputs:  digest of the inputs of the search
+        :param result:  aggregated result of the metric
+        :type command:  `string`
+        :type metric:   `string`
+        :type inputs:   `string`
+        :type result:   `float`
+
+        """
+        self.__create_points()
+        self.insert('POINTS', dict(command=command, metric=metric,
+                                   inputs=inputs, result=result))
+
+    def get_point(self, command, metric, inputs):
+        """Return the cached aggregated result of an upsampler command.
+
+        :param command: upsampler command
+        :param metric:  name of the metric
+        :param inputs:  digest of the inputs of the search
+        :type command:  `string`
+        :type metric:   `string`
+        :type inputs:   `string`
+
+        :return:        the aggregated result (`None` if it is not cached)
+        :rtype:         `float`
+
+        """
+        self.__create_points()
+        rows = self.sql_fetchall('SELECT result FROM POINTS WHERE command = ?'
+                                 ' AND metric = ? AND inputs = ?',
+                                 [command, metric, inputs])
+        return rows[0][0] if rows else None
+
     def close(self):
         """Close the connection to the database."""
         self.dbase.close()
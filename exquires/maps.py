@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# coding: utf-8
+#
+#  Copyright (c) 2012, Adam Turcotte (adam.turcotte@gmail.com)
+#                      Nicolas Robidoux (nicolas.robidoux@gmail.com)
+#  License: BSD 2-Clause License
+#
+#  This file is part of the
+#  EXQUIRES (EXtensible QUantitative Image RESampling) test suite
+#
+
+"""Provides access to the per-pixel error maps saved by :ref:`exquires-run`.
+
+When :ref:`exquires-run` or :ref:`exquires-update` is called with
+:option:`--save-maps`, the maps of the selected upsamplers are written to a
+store named after the project (for example, :file:`project1_maps`). Each map
+is a `.npy` file that is loaded as a read-only memory-mapped array, so only
+the parts of a map that are accessed are read from disk.
+
+"""
+
+import fnmatch
+import os
+
+import numpy
+
+from exquires import tools
+
+
+class MapStore(object):
+
+    """This class provides an interface to a store of per-pixel error maps.
+
+    The maps of each comparison are stored in a directory with the following
+    layout::
+
+        <store>/<image>/<downsampler>/<ratio>/<upsampler>/<map>.npy
+
+    :param directory: directory of the store
+    :type directory:  `path`
+
+    """
+
+    def __init__(self, directory):
+        """Create a new :class:`MapStore` object."""
+        self.directory = directory
+
+    def path(self, image, downsampler, ratio, upsampler):
+        """Return the directory of a comparison, creating it if necessary.
+
+        :param image:       name of the image
+        :param downsampler: name of the downsampler
+        :param ratio:       resampling ratio
+        :param upsampler:   name of the upsampler
+        :type image:        `string`
+        :type downsampler:  `string`
+        :type ratio:        `string`
+        :type upsampler:    `string`
+
+        :return:            the directory to write the maps to
+        :rtype:             `path`
+
+        """
+        return tools.create_dir(self.directory, os.path.join(
+            image, downsampler, ratio, upsampler))
+
+    def find(self, image='*', downsampler='*', ratio='*', upsampler='*',
+             name='*'):
+        """Return the saved maps that match the specified patterns.
+
+        Each argument can contain Unix shell-style wildcards.
+
+        :param image:       pattern matching the names of images
+        :param downsampler: pattern matching the names of downsamplers
+        :param ratio:       pattern matching the ratios
+        :param upsampler:   pattern matching the names of upsamplers
+        :param name:        pattern matching the names of maps
+        :type image:        `string`
+        :type downsampler:  `string`
+        :type ratio:        `string`
+        :type upsampler:    `string`
+        :type name:         `string`
+
+        :return:            (image, downsampler, ratio, upsampler, name)
+                            tuples of the matching maps
+        :rtype:             `list of tuples`
+
+        """
+        keys = [()]
+        for pattern in [image, downsampler, ratio, upsampler]:
+            keys = [key + (entry,) for key in keys
+                    for entry in self.__list(key, pattern)]
+        return [key + (os.path.splitext(entry)[0],) for key in keys
+                for entry in self.__list(key, '.'.join([name, 'npy']))]
+
+    def load(self, image, downsampler, ratio, upsampler, name):
+        """Load a map without reading it into memory.
+
+        :param image:       name of the image
+        :param downsampler: name of the downsampler
+        :param ratio:       resampling ratio
+        :param upsampler:   name of the upsampler
+        :param name:        name of the map (`diff`, `cmc`, or `ssim`)
+        :type image:        `string`
+        :type downsampler:  `string`
+        :type ratio:        `string`
+        :type upsampler:    `string`
+        :type name:         `string`
+
+        :return:            the read-only memory-mapped map
+        :rtype:             :class:`numpy.memmap`
+
+        """
+        return numpy.load(os.path.join(
+            self.directory, image, downsampler, ratio, upsampler,
+            '.'.join([name, 'npy'])
+        ), mmap_mode='r')
+
+    def __list(self, key, pattern):
+        """Private method to list the entries of a directory in the store.
+
+        .. note::
+
+            This is a private method called by :meth:`find`.
+
+        :param key:     names of the directory relative to the store
+        :param pattern: pattern matching the entries to return
+        :type key:      `tuple of strings`
+        :type pattern:  `string`
+
+        :return:        the sorted entries that match the pattern
+        :rtype:         `list of strings`
+
+        """
+        directory = os.path.join(self.directory, *key)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(fnmatch.filter(os.listdir(directory), pattern))
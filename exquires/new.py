@@ -28,10 +28,22 @@ Use the :option:`-I`\:option:`--image` option to provide a list of images to
 include in the project file. If no images are specified, a default image
 (:file:`wave.tif`) is included in the project file.
 
+Use the :option:`-S`\:option:`--sweep` option to add an upsampler for every
+combination of the parameter values of an ImageMagick filter. Each sweep is
+given as `FILTER:PARAM=VALUES:...`, where the parameters are `lobes`, `blur`,
+`beta`, `lin`, `dist`, and `interp` (see :func:`_magick`), and the values are
+either a comma-separated list or a range `LOW..HIGH/COUNT` of evenly spaced
+values. For example, `Lanczos:lobes=2,3:blur=0.88..0.98/6:dist=1:lin=0,1`
+adds 24 EWA Lanczos upsamplers. Upsamplers whose commands are identical once
+canonicalized (see :func:`_canonical`) are only included once.
+
 Manually edit this file to customize your project.
 
 """
 
+import argparse
+import itertools
+import re
 from os import path
 
 from configobj import ConfigObj
@@ -50,8 +62,9 @@ def _magick(method, **kwargs):
         :func:`_std_int_lin_tensor_mtds_1`, :func:`_std_int_lin_tensor_mtds_2`,
         :func:`_novel_int_lin_flt_mtds`, :func:`_std_nonint_lin_tensor_mtds`,
         :func:`_std_int_ewa_lin_flt_mtds`,
-        :func:`_std_nonint_ewa_lin_flt_mtds`, and
-        :func:`_novel_nonint_ewa_lin_flt_mtds`.
+        :func:`_std_nonint_ewa_lin_flt_mtds`,
+        :func:`_novel_nonint_ewa_lin_flt_mtds`, and
+        :func:`_add_sweep_upsamplers`.
 
     :param method: method to use with `-resize` or `-distort Resize`
     :param lin:    `True` if using a linear method
@@ -198,6 +211,11 @@ def _add_default_downsamplers(ini):
         '{1} = output image',
         '{2} = downsampling ratio',
         '{3} = downsampled size (width or height)',
+        '{ext} = extension of the intermediate images (default: tif)',
+        'Words enclosed by [ and ] are repeated for each ratio, so that a',
+        'single command writes the downsampled images for all ratios.',
+        'A command starting with worker: starts a long-lived worker.',
+        'A command py:module:function calls a Python function instead.',
         '',
         'WARNING: Be sure to use a unique name for each downsampler.'
     ]
@@ -491,9 +509,14 @@ def _add_default_upsamplers(ini):
         'To add an upsampler, provide the command to execute it.',
         'The command can make use of the following replacement fields:',
         '{0} = input image',
-        '{1} = output image',
+        '{1} = output image (leave out to write the image to stdout)',
         '{2} = upsampling ratio',
-        '{3} = upsampled size (always 840)'
+        '{3} = upsampled size (840, smaller with exquires-run --smoke)',
+        '{ext} = extension of the intermediate images (default: tif)',
+        'Words enclosed by [ and ] are repeated for each image, so that a',
+        'single command upsamples the images for all ratios.',
+        'A command starting with worker: starts a long-lived worker.',
+        'A command py:module:function calls a Python function instead.'
     ]
 
     _std_int_lin_tensor_mtds_1(ini[ups])
@@ -505,6 +528,166 @@ def _add_default_upsamplers(ini):
     _novel_nonint_ewa_lin_flt_mtds(ini[ups])
 
 
+def _sweep(value):
+    """Parse a parameter sweep given on the command line.
+
+    .. note::
+
+        This is a private function called by :func:`main`.
+
+    :param value: the sweep, given as `FILTER:PARAM=VALUES:...`
+    :type value:  `string`
+
+    :return:      the filter and the (parameter, values) pairs
+    :rtype:       `string`, `list of tuples`
+
+    :raises:      :class:`argparse.ArgumentTypeError`
+
+    """
+    method, params = value.split(':')[0], []
+    for item in value.split(':')[1:]:
+        key, _, values = item.partition('=')
+        if key not in ('lobes', 'blur', 'beta', 'lin', 'dist', 'interp'):
+            msg = 'invalid sweep parameter: {!r}'.format(key)
+            raise argparse.ArgumentTypeError(msg)
+
+        # Expand a range of evenly spaced values.
+        match = re.match(r'^(.+)\.\.(.+)/(\d+)$', values)
+        try:
+            if match:
+                low, high = float(match.group(1)), float(match.group(2))
+                count = int(match.group(3))
+                step = (high - low) / max(count - 1, 1)
+                values = ['%.12g' % (low + i * step) for i in range(count)]
+            else:
+                values = values.split(',')
+                for val in values:
+                    float(val)
+        except ValueError:
+            msg = 'invalid sweep values: {!r}'.format(item)
+            raise argparse.ArgumentTypeError(msg)
+
+        # The number of lobes must be a positive integer.
+        if key == 'lobes':
+            if any(not float(val).is_integer() or float(val) < 1
+                   for val in values):
+                msg = 'lobes must be positive integers: {!r}'.format(item)
+                raise argparse.ArgumentTypeError(msg)
+            values = [str(int(float(val))) for val in values]
+        params.append((key, values))
+    if not method or not params:
+        msg = 'invalid sweep: {!r} (use FILTER:PARAM=VALUES)'.format(value)
+        raise argparse.ArgumentTypeError(msg)
+    return method, params
+
+
+def _canonical(command):
+    """Return the canonical form of an ImageMagick command.
+
+    Extra whitespace is removed, numbers in `-define` settings are written in
+    a single way (so `.9` and `0.90` are the same), and a blur of `1` (which
+    leaves the filter unchanged) is dropped.
+
+    .. note::
+
+        This is a private function called by :func:`_add_sweep_upsamplers`.
+
+    :param command: the ImageMagick command
+    :type command:  `string`
+
+    :return:        the canonical command
+    :rtype:         `string`
+
+    """
+    words = command.split()
+    canonical = []
+    i = 0
+    while i < len(words):
+        if words[i] == '-define' and i + 1 < len(words):
+            key, _, setting = words[i + 1].partition('=')
+            try:
+                setting = repr(float(setting))
+            except ValueError:
+                pass
+            if not (key == 'filter:blur' and setting == '1.0'):
+                canonical.extend([words[i], '='.join([key, setting])])
+            i += 2
+        else:
+            canonical.append(words[i])
+            i += 1
+    return ' '.join(canonical)
+
+
+def _add_sweep_upsamplers(ini, sweeps):
+    """Add the upsamplers of parameter sweeps to the :file:`.ini` file.
+
+    Each upsampler is named after its filter and parameter values, for
+    example `ewa_lanczos2_blur0.9_linear`. An upsampler is skipped if its
+    canonical command is the same as that of an upsampler already in the
+    file, so the same command is never run twice under different names. If
+    the name is taken by another command, `_sweep` is appended to it,
+    followed by a number if that name is taken as well.
+
+    .. note::
+
+        This is a private function called by :func:`main`.
+
+    :param ini:    the :file:`.ini` file to modify
+    :param sweeps: the filter and the (parameter, values) pairs of each sweep
+    :type ini:     :class:`configobj.ConfigObj`
+    :type sweeps:  `list of tuples`
+
+    :return:       names of the skipped upsamplers, keyed by the name of the
+                   upsampler with the same command
+    :rtype:        `dict`
+
+    """
+    ini_ups = ini['Upsamplers']
+    commands = dict((_canonical(cmd), name) for name, cmd in
+                    reversed(ini_ups.items()))
+    skipped = {}
+    for method, params in sweeps:
+        keys = [key for key, values in params]
+        for values in itertools.product(*[values for key, values in params]):
+            kwargs = dict(zip(keys, values))
+            lobes = int(kwargs.pop('lobes', 0))
+            lin, dist, interp = [bool(float(kwargs.pop(key, 0)))
+                                 for key in ('lin', 'dist', 'interp')]
+            cmd = _magick(method, lobes=lobes, lin=lin, dist=dist,
+                          interp=interp, **kwargs)
+
+            # Name the upsampler after its filter and parameters.
+            name = [method.lower()]
+            if lobes:
+                name[0] = ''.join([name[0], str(lobes)])
+            if dist:
+                name.insert(0, 'ewa')
+            elif interp:
+                name.insert(0, 'interp')
+            for key in ('blur', 'beta'):
+                if key in kwargs:
+                    name.append(''.join([key, kwargs[key]]))
+            name.append('linear' if lin else 'srgb')
+            name = '_'.join(name)
+
+            # Skip any upsampler that repeats a command.
+            canonical = _canonical(cmd)
+            if canonical in commands:
+                skipped.setdefault(commands[canonical], []).append(name)
+                continue
+
+            # Rename an upsampler whose name is taken by another command.
+            if name in ini_ups:
+                base, count = '_'.join([name, 'sweep']), 1
+                name = base
+                while name in ini_ups:
+                    count += 1
+                    name = ''.join([base, str(count)])
+            commands[canonical] = name
+            ini_ups[name] = cmd
+    return skipped
+
+
 def _add_default_metrics(ini):
     """Add the default metrics to the specified :file:`.ini` file.
 
@@ -552,6 +735,7 @@ def _add_default_metrics(ini):
     ini[metrics]['blur_4'] = _metric('blur_4', 'l_4', 0)
     ini[metrics]['blur_inf'] = _metric('blur_inf', 'l_inf', 0)
     ini[metrics]['mssim'] = _metric('mssim', 'l_1', 1)
+    ini[metrics]['ms_ssim'] = _metric('ms_ssim', 'l_1', 1)
 
 
 def main():
@@ -574,6 +758,9 @@ def main():
     parser.add_argument('-I', '--image', metavar='IMAGE', type=str, nargs='+',
                         help='the test images to use (default: wave.tif)',
                         default=[wave])
+    parser.add_argument('-S', '--sweep', metavar='SWEEP', type=_sweep,
+                        nargs='+', default=[],
+                        help='add upsamplers for these parameter sweeps')
 
     # Attempt to parse the command-line arguments.
     args = parser.parse_args()
@@ -586,8 +773,14 @@ def main():
     _add_default_ratios(ini)
     _add_default_downsamplers(ini)
     _add_default_upsamplers(ini)
+    skipped = _add_sweep_upsamplers(ini, args.sweep)
     _add_default_metrics(ini)
 
+    # List the upsamplers that were skipped as duplicates.
+    for name in sorted(skipped):
+        print ' '.join(['skipped', ', '.join(skipped[name]),
+                        '(same command as {})'.format(name)])
+
     # Write the project file.
     ini.write()
 
@@ -27,14 +27,30 @@ To perform the operations, call :meth:`Operations.compute`.
 
 """
 
+import argparse
+import fnmatch
 import os
 import shutil
-from subprocess import call, check_output
-
-from exquires import database, progress, tools
+import signal
+import tempfile
+from fractions import Fraction
+from exquires import (cache, compare, database, maps, progress, stats, tools,
+                      workers)
 
 # pylint: disable-msg=R0903
 
+# Width and height of the master images.
+_SIZE = 840
+
+# Smallest crop used in smoke-test mode (large enough for 5 MS-SSIM scales).
+_SMOKE_SIZE = 176
+
+# Free space needed in the scratch directory for each image, as a multiple of
+# the size of the master image (including its shared planes), plus a fixed
+# margin (in bytes).
+_SCRATCH_FACTOR = 12
+_SCRATCH_MARGIN = 64 << 20
+
 
 class Operations(object):
 
@@ -78,6 +94,13 @@ class Operations(object):
         :param args.metrics:     current metrics
         :param args.config_file: current configuration file
         :param args.config_bak:  previous configuration file
+        :param args.save_maps:   upsamplers to save error maps for
+        :param args.approximate: fraction of the rows to sample
+        :param args.smoke:       `True` if running on cropped masters
+        :param args.halve:       fraction of upsamplers to drop per image
+        :param args.no_cache:    `True` if not using the global result cache
+        :param args.scratch:     preferred directory for intermediate images
+        :param args.format:      extension of the intermediate images
         :param old:              old configuration entries to be removed
         :type args:              :class:`argparse.Namespace`
         :type args.prog:         `string`
@@ -88,6 +111,13 @@ class Operations(object):
         :type args.metrics:      `dict`
         :type args.config_file:  `path`
         :type args.config_bak:   `path`
+        :type args.save_maps:    `list of strings`
+        :type args.approximate:  `float`
+        :type args.smoke:        `boolean`
+        :type args.halve:        `float`
+        :type args.no_cache:     `boolean`
+        :type args.scratch:      `path`
+        :type args.format:       `string`
         :type old:               :class:`argparse.Namespace`
 
         """
@@ -111,7 +141,43 @@ class Operations(object):
         # Open the database connection.
         args.dbase = database.Database(args.dbase_file)
 
-        success = True
+        # Create the engine used to evaluate the metrics.
+        args.engine = compare.Engine(sample=args.approximate)
+
+        # Run the resampling commands, starting any worker when first needed.
+        args.workers = workers.Workers(args.engine)
+
+        # Open the store for any error maps to be saved.
+        if args.smoke:
+            args.maps = maps.MapStore('_'.join([args.proj, 'smoke', 'maps']))
+        else:
+            args.maps = maps.MapStore('_'.join([args.proj, 'maps']))
+
+        # No upsamplers have been dropped by successive halving yet.
+        args.pruned = set()
+
+        # Keep track of the downsampled images to detect identical ones.
+        args.downsampled = {}
+        args.log = []
+
+        # Memoize the metric results of identical upsampled images.
+        args.results = {}
+
+        # No master image has been selected yet.
+        args.master = args.master_hash = None
+
+        # Open the cache of results shared by all projects.
+        args.cache = None
+        if not args.no_cache:
+            args.cache = cache.Cache(cache.default_path())
+
+        # The scratch trees are created as needed by Images.compute.
+        args.tree, args.trees = None, []
+
+        # Clean up as for an interrupt if the process is terminated.
+        handler = signal.signal(signal.SIGTERM, _terminate)
+
+        success, error = False, None
         try:
             # Remove old database tables.
             if old:
@@ -119,23 +185,30 @@ class Operations(object):
                 args.dbase.drop_tables(old.images,
                                        old.downsamplers, old.ratios)
 
-            # Create the project folder if it does not exist.
-            tools.create_dir(args.proj)
-
             # Compute for all images.
             for image in self.images:
                 image.compute(args)
+            success = True
         except StandardError as std_err:
-            success = False
             error = std_err
         finally:
-            # Remove the project directory and close the database.
-            shutil.rmtree(args.proj, True)
+            # Stop the workers, remove the scratch trees, and close the
+            # database.
+            signal.signal(signal.SIGTERM, handler)
+            args.workers.close()
+            for tree in args.trees:
+                shutil.rmtree(tree, True)
             args.dbase.close()
 
+            # Enforce the size limit of the cache and close it.
+            if args.cache is not None:
+                args.cache.evict()
+                args.cache.close()
+
             if success:
-                # Backup the project file.
-                shutil.copyfile(args.config_file, args.config_bak)
+                # Backup the project file (unless the run was a smoke test).
+                if not args.smoke:
+                    shutil.copyfile(args.config_file, args.config_bak)
 
                 # Delete the database backup.
                 if os.path.isfile(dbase_bak):
@@ -154,7 +227,16 @@ class Operations(object):
                 del prg
 
                 # Print an error message.
-                print error
+                if error:
+                    print error
+
+            # Print any warnings about the accuracy of the metrics.
+            for warning in args.engine.warnings:
+                print warning
+
+            # Print the tables whose results were copied.
+            for message in args.log:
+                print message
 
 
 class Images(object):
@@ -202,6 +284,11 @@ class Images(object):
         :param args.met_same:   unchanged metrics
         :param args.metrics:    current metrics
         :param args.do_op:      updates the displayed progress
+        :param args.halve:      fraction of upsamplers to drop per image
+        :param args.pruned:     upsamplers dropped by successive halving
+        :param args.scratch:    preferred directory for intermediate images
+        :param args.tree:       current scratch tree
+        :param args.trees:      all of the scratch trees created
         :type args:             :class:`argparse.Namespace`
         :type args.dbase_file:  `path`
         :type args.dbase:       :class:`database.Database`
@@ -210,15 +297,28 @@ class Images(object):
         :type args.met_same:    `dict`
         :type args.metrics:     `dict`
         :type args.do_op:       `function`
+        :type args.halve:       `float`
+        :type args.pruned:      `set of strings`
+        :type args.scratch:     `path`
+        :type args.tree:        `path`
+        :type args.trees:       `list of paths`
 
         """
         # Compute for all images.
-        for args.image in self.images:
-            # Make a copy of the test image.
+        for count, args.image in enumerate(self.images, 1):
+            # Use the test image in place, recording its state.
             if len(self):
-                args.image_dir = tools.create_dir(args.proj, args.image)
-                args.master = os.path.join(args.image_dir, 'master.tif')
-                shutil.copyfile(self.images[args.image], args.master)
+                original = self.images[args.image]
+                stamp = _stamp(original)
+                args.tree = _scratch_tree(args, _SCRATCH_MARGIN +
+                                          _SCRATCH_FACTOR * stamp[0])
+                args.image_dir = tools.create_dir(args.tree, args.image)
+                args.master = _master_path(original, args.image_dir)
+                args.master_hash = tools.hash_file(args.master)
+
+                # Decode the test image once, mapping its planes from files.
+                args.engine.share(args.master, tools.create_dir(
+                    args.image_dir, '.planes'))
 
             # Compute for all downsamplers.
             for downsampler in self.downsamplers:
@@ -226,8 +326,19 @@ class Images(object):
 
             # Remove the directory for this image.
             if len(self):
+                args.engine.release(args.master)
                 shutil.rmtree(args.image_dir, True)
 
+                # Make sure the test image did not change during the run.
+                if (_stamp(original) != stamp and
+                        tools.hash_file(original) != args.master_hash):
+                    raise IOError(' '.join(['image modified during the run:',
+                                            original]))
+
+            # Drop the worst upsamplers before moving on to the next image.
+            if args.halve and count < len(self.images):
+                _halve(args, self.images.keys()[:count])
+
 
 class Downsamplers(object):
 
@@ -359,6 +470,12 @@ class Ratios(object):
         :param args.master:          master image to downsample
         :param args.downsampler:     name of the downsampler
         :param args.downsampler_dir: directory to store dowsampled images
+        :param args.engine:          evaluates the metrics
+        :param args.smoke:           `True` if running on cropped masters
+        :param args.downsampled:     tables keyed by downsampled image
+        :param args.log:             messages to print once done
+        :param args.format:          extension of the intermediate images
+        :param args.workers:         runs the resampling commands
         :param downsamplers:         downsamplers to use
         :param same:                 `True` if accessing an existing table
         :type args:                  :class:`argparse.Namespace`
@@ -374,33 +491,70 @@ class Ratios(object):
         :type args.master:           `path`
         :type args.downsampler:      `string`
         :type args.downsampler_dir:  `path`
+        :type args.engine:           :class:`compare.Engine`
+        :type args.smoke:            `boolean`
+        :type args.downsampled:      `dict`
+        :type args.log:              `list of strings`
+        :type args.format:           `string`
+        :type args.workers:          :class:`workers.Workers`
         :type downsamplers:          `dict`
         :type same:                  `boolean`
 
         """
         is_same = self.same and same
+        command = downsamplers[args.downsampler]
+
+        # Downsample the images for all ratios up front if the downsampler or
+        # any remaining upsampler uses a batch command.
+        batch = len(self) and not args.smoke and (
+            tools.is_batch(command) or
+            any(ups.batch_upsamplers(args) for ups in self.upsamplers))
+        if batch:
+            jobs = []
+            for ratio, small_size in self.ratios.items():
+                small = os.path.join(args.downsampler_dir,
+                                     '.'.join([ratio, args.format]))
+                jobs.append((args.master, small, ratio, small_size))
+            args.workers.resample(command, jobs, args.format)
+            self.__batch_upsample(args, command, jobs, is_same)
 
         # Compute for all ratios.
+        master, master_hash = args.master, args.master_hash
         for args.ratio in self.ratios:
+            args.size, small_size = _SIZE, self.ratios[args.ratio]
+            key = None
             if len(self):
                 args.small = os.path.join(args.downsampler_dir,
-                                          '.'.join([args.ratio, 'tif']))
+                                          '.'.join([args.ratio, args.format]))
 
                 # Create a directory for this ratio.
                 ratio_dir = tools.create_dir(args.downsampler_dir, args.ratio)
 
+                # Crop the master image in smoke-test mode.
+                if args.smoke:
+                    args.size, small_size = _smoke_sizes(args.ratio)
+                    args.master = os.path.join(
+                        args.downsampler_dir,
+                        '_'.join([args.ratio, 'master.tif'])
+                    )
+                    _crop(master, args.master, args.size)
+                    args.master_hash = tools.hash_file(args.master)
+
                 # Downsample master.tif by ratio using downsampler.
                 #  {0} input image path (master)
                 #  {1} output image path (small)
                 #  {2} downsampling ratio
                 #  {3} downsampled size (width or height)
+                #  {ext} extension of the intermediate images
                 args.do_op(args)
-                call(
-                    downsamplers[args.downsampler].format(
-                        args.master, args.small,
-                        args.ratio, self.ratios[args.ratio]
-                    ).split()
-                )
+                if not batch:
+                    args.workers.resample(command, [
+                        (args.master, args.small, args.ratio, small_size)
+                    ], args.format)
+                key = args.image, args.ratio, tools.hash_file(args.small)
+                args.down_cmd = tools.batch_command(
+                    command, [('{0}', '{1}', args.ratio, small_size)],
+                    args.format)
 
             if is_same:
                 # Access the existing database table.
@@ -413,18 +567,101 @@ class Ratios(object):
                 args.table = args.dbase.add_table(
                     args.image, args.downsampler, args.ratio, args.metrics)
 
-            # Compute for all upsamplers.
-            for upsampler in self.upsamplers:
-                upsampler.compute(args, is_same)
+            source = None if is_same else args.downsampled.get(key)
+            if source:
+                # Copy the results for an identical downsampled image.
+                args.dbase.copy_rows(source, args.table, args.metrics)
+                args.log.append(' '.join([
+                    args.table, 'copied from', source,
+                    '(identical downsampled images)'
+                ]))
+            else:
+                # Compute for all upsamplers.
+                for upsampler in self.upsamplers:
+                    upsampler.compute(args, is_same)
+                if key:
+                    args.downsampled.setdefault(key, args.table)
 
             # Remove the directory for this ratio.
             if len(self):
+                args.engine.release(args.small)
                 shutil.rmtree(ratio_dir, True)
 
+            # Restore the uncropped master image.
+            if args.master != master:
+                args.engine.release(args.master)
+                os.remove(args.master)
+                args.master, args.master_hash = master, master_hash
+
             # Delete the backup table.
             if is_same:
                 args.dbase.drop_backup(args.table_bak)
 
+    def __batch_upsample(self, args, command, jobs, is_same):
+        """Private method to run each batch upsampler once for all ratios.
+
+        .. note::
+
+            This is a private method called by :meth:`compute`.
+
+        The ratios whose results are copied from an identical downsampled
+        image are skipped, as are the upsamplers that do not need to upsample
+        for a ratio (see :meth:`Upsamplers.needed`). The upsampled images are
+        written where :meth:`Upsamplers.compute` uses them, and only as many
+        as the scratch tree has room for: the others are upsampled by
+        :meth:`Upsamplers.compute`, one ratio at a time.
+
+        :param args:                 arguments
+        :param args.image:           name of the image
+        :param args.master:          master image to downsample
+        :param args.downsampler_dir: directory to store dowsampled images
+        :param args.downsampled:     tables keyed by downsampled image
+        :param args.tree:            current scratch tree
+        :param args.format:          extension of the intermediate images
+        :param args.workers:         runs the resampling commands
+        :param command:              the downsampling command
+        :param jobs:                 master image, downsampled image, ratio,
+                                     and downsampled size of each ratio
+        :param is_same:              `True` if accessing existing tables
+        :type args:                  :class:`argparse.Namespace`
+        :type args.image:            `string`
+        :type args.master:           `path`
+        :type args.downsampler_dir:  `path`
+        :type args.downsampled:      `dict`
+        :type args.tree:             `path`
+        :type args.format:           `string`
+        :type args.workers:          :class:`workers.Workers`
+        :type command:               `string`
+        :type jobs:                  `list of tuples`
+        :type is_same:               `boolean`
+
+        """
+        batches = {}
+        for dummy, args.small, args.ratio, small_size in jobs:
+            key = args.image, args.ratio, tools.hash_file(args.small)
+            if not is_same and key in args.downsampled:
+                continue
+            args.size = _SIZE
+            args.down_cmd = tools.batch_command(
+                command, [('{0}', '{1}', args.ratio, small_size)],
+                args.format)
+            ratio_dir = tools.create_dir(args.downsampler_dir, args.ratio)
+            for ups in self.upsamplers:
+                for upsampler, up_cmd in ups.needed(args):
+                    large = os.path.join(ratio_dir,
+                                         '.'.join([upsampler, args.format]))
+                    batches.setdefault(up_cmd, []).append(
+                        (args.small, large, args.ratio, args.size))
+
+        # Write no more upsampled images than the scratch tree can hold.
+        room = ((_free_space(args.tree) - _SCRATCH_MARGIN) //
+                max(os.path.getsize(args.master), 1))
+        for up_cmd in sorted(batches):
+            up_jobs = batches[up_cmd][:max(room, 0)]
+            if len(up_jobs) > 1:
+                args.workers.resample(up_cmd, up_jobs, args.format)
+                room -= len(up_jobs)
+
 
 class Upsamplers(object):
 
@@ -459,6 +696,63 @@ class Upsamplers(object):
         """
         return self.len
 
+    def batch_upsamplers(self, args):
+        """Return the upsamplers with batch commands that are still used.
+
+        :param args:        arguments
+        :param args.pruned: upsamplers dropped by successive halving
+        :type args:         :class:`argparse.Namespace`
+        :type args.pruned:  `set of strings`
+
+        :return:            name and command of each upsampler
+        :rtype:             `list of tuples`
+
+        """
+        if not len(self):
+            return []
+        return [(upsampler, command)
+                for upsampler, command in self.upsamplers.items()
+                if upsampler not in args.pruned and tools.is_batch(command)]
+
+    def needed(self, args):
+        """Return the upsamplers with batch commands that must upsample.
+
+        An upsampler must upsample unless every result is found in the cache
+        and neither error histograms nor error maps are requested for it.
+
+        :param args:             arguments
+        :param args.pruned:      upsamplers dropped by successive halving
+        :param args.ratio:       resampling ratio
+        :param args.size:        width of the master image
+        :param args.master_hash: digest of the master image
+        :param args.cache:       global cache of results (if used)
+        :param args.down_cmd:    downsampling command with the ratio and size
+                                 filled in
+        :param args.sketch:      families of error histograms to store
+        :param args.save_maps:   upsamplers to save error maps for
+        :param args.format:      extension of the intermediate images
+        :type args:              :class:`argparse.Namespace`
+        :type args.pruned:       `set of strings`
+        :type args.ratio:        `string`
+        :type args.size:         `integer`
+        :type args.master_hash:  `string`
+        :type args.cache:        :class:`cache.Cache`
+        :type args.down_cmd:     `string`
+        :type args.sketch:       `list of strings`
+        :type args.save_maps:    `list of strings`
+        :type args.format:       `string`
+
+        :return:                 name and command of each upsampler
+        :rtype:                  `list of tuples`
+
+        """
+        return [(upsampler, command)
+                for upsampler, command in self.batch_upsamplers(args)
+                if args.cache is None or args.sketch or
+                _save_maps(args, upsampler) or
+                any(args.cache.get(self.__cache_key(args, upsampler, metric))
+                    is None for metric in self.metrics)]
+
     def compute(self, args, same):
         """Perform all operations for this set of ratios.
 
@@ -477,8 +771,21 @@ class Upsamplers(object):
         :param args.downsampler_dir: directory to store dowsampled images
         :param args.ratio:           resampling ratio
         :param args.small:           downsampled image
+        :param args.size:            width of the master image
         :param args.table:           name of the table to insert the row into
         :param args.table_bak:       name of the backup table (if it exists)
+        :param args.engine:          evaluates the metrics
+        :param args.save_maps:       upsamplers to save error maps for
+        :param args.map_type:        data type of saved error maps
+        :param args.maps:            store of saved error maps
+        :param args.sketch:          families of error histograms to store
+        :param args.pruned:          upsamplers dropped by successive halving
+        :param args.master_hash:     digest of the master image
+        :param args.results:         metric results keyed by image digests
+        :param args.cache:           global cache of results (if used)
+        :param args.down_cmd:        downsampling command with the ratio and
+                                     size filled in
+        :param args.format:          extension of the intermediate images
         :param same:                 `True` if accessing an existing table
         :type args:                  :class:`argparse.Namespace`
         :type args.dbase_file:       `path`
@@ -495,8 +802,20 @@ class Upsamplers(object):
         :type args.downsampler_dir:  `path`
         :type args.ratio:            `string`
         :type args.small:            `path`
+        :type args.size:             `integer`
         :type args.table:            `string`
         :type args.table_bak:        `string`
+        :type args.engine:           :class:`compare.Engine`
+        :type args.save_maps:        `list of strings`
+        :type args.map_type:         `string`
+        :type args.maps:             :class:`maps.MapStore`
+        :type args.sketch:           `list of strings`
+        :type args.pruned:           `set of strings`
+        :type args.master_hash:      `string`
+        :type args.results:          `dict`
+        :type args.cache:            :class:`cache.Cache`
+        :type args.down_cmd:         `string`
+        :type args.format:           `string`
         :type same:                  `boolean`
 
         """
@@ -504,6 +823,13 @@ class Upsamplers(object):
 
         # Compute for all upsamplers.
         for upsampler in self.upsamplers:
+            # Skip any upsampler dropped by successive halving, counting its
+            # operations so that the progress still reaches its total.
+            if upsampler in args.pruned:
+                for dummy in range(len(self) / len(self.upsamplers)):
+                    args.do_op(args, upsampler)
+                continue
+
             row = {}
             if is_same:
                 # Access the existing table row.
@@ -518,34 +844,436 @@ class Upsamplers(object):
                 # Construct the path to the upsampled image.
                 large = os.path.join(
                     os.path.dirname(args.small), args.ratio,
-                    '.'.join([upsampler, 'tif'])
+                    '.'.join([upsampler, args.format])
                 )
 
-                # Upsample ratio.tif back to 840 using upsampler.
-                #  {0} input image path (small)
-                #  {1} output image path (large)
-                #  {2} upsampling ratio
-                #  {3} upsampled size (always 840)
-                args.do_op(args, upsampler)
-                call(self.upsamplers[upsampler].format(
-                        args.small, large, args.ratio, 840).split())
-
-                # Compute for all metrics.
+                # Compute for all metrics, keeping the confidence intervals
+                # of any other metric.
+                large_hash = None
+                args.dbase.delete_intervals(args.table, upsampler,
+                                            list(self.metrics))
                 for metric in self.metrics:
-                    # Compare master.tif to upsampler.tif.
-                    #  {0} reference image path (master)
-                    #  {1} test image path (large)
+                    # Look up the result in the global cache.
                     args.do_op(args, upsampler, metric)
-                    row[metric] = float(
-                        check_output(
-                            self.metrics[metric][0].format(args.master,
-                                                           large).split()
-                        )
+                    found = None
+                    if args.cache is not None:
+                        cache_key = self.__cache_key(args, upsampler, metric)
+                        found = args.cache.get(cache_key)
+
+                    if found is None:
+                        # Upsample the image the first time it is needed.
+                        if large_hash is None:
+                            large_hash = self.__upsample(args, upsampler,
+                                                         large)
+
+                        # Reuse the result of an identical upsampled image.
+                        key = (args.master_hash, large_hash,
+                               self.metrics[metric][0])
+                        if key not in args.results:
+                            # Compare master.tif to upsampler.tif.
+                            #  {0} reference image path (master)
+                            #  {1} test image path (large)
+                            result = args.engine.compare(
+                                self.metrics[metric][0].format(args.master,
+                                                               large)
+                            )
+                            args.results[key] = result, args.engine.bounds
+                        found = args.results[key]
+                        if args.cache is not None:
+                            args.cache.put(cache_key, *found)
+                    row[metric], bounds = found
+
+                    # Store the confidence interval of an approximate result.
+                    if bounds:
+                        args.dbase.insert_interval(args.table, upsampler,
+                                                   metric, bounds)
+
+                # Save the results cached for this upsampler at once.
+                if args.cache is not None:
+                    args.cache.commit()
+
+                # Upsample the image if it is needed for histograms or maps.
+                save_maps = _save_maps(args, upsampler)
+                if large_hash is None and (args.sketch or save_maps):
+                    large_hash = self.__upsample(args, upsampler, large)
+
+                # Store the requested error histograms, replacing only the
+                # histograms of the same families.
+                for family in args.sketch:
+                    hist = args.engine.sketch(args.master, large, family)
+                    args.dbase.insert_sketch(args.table, upsampler, hist)
+
+                # Save the error maps if requested for this upsampler.
+                if save_maps:
+                    args.engine.save_maps(
+                        args.master, large, args.maps.path(
+                            args.image, args.downsampler, args.ratio,
+                            upsampler
+                        ), args.map_type
                     )
 
+                # Count the upsampling step if every result was cached.
+                if large_hash is None:
+                    args.do_op(args, upsampler)
+
                 # Remove the upsampled image.
-                os.remove(large)
+                if large_hash is not None:
+                    args.engine.release(large)
+                    if os.path.isfile(large):
+                        os.remove(large)
 
             # Add the new row to the table.
             if row:
                 args.dbase.insert(args.table, row)
+
+    def __cache_key(self, args, upsampler, metric):
+        """Private method to return the key of a result in the global cache.
+
+        .. note::
+
+            This is a private method called by :meth:`needed` and
+            :meth:`compute`.
+
+        :param args:             arguments
+        :param args.ratio:       resampling ratio
+        :param args.size:        width of the master image
+        :param args.master_hash: digest of the master image
+        :param args.cache:       global cache of results
+        :param args.down_cmd:    downsampling command with the ratio and size
+                                 filled in
+        :param args.approximate: fraction of the rows to sample
+        :param args.format:      extension of the intermediate images
+        :param upsampler:        name of the upsampler
+        :param metric:           name of the metric
+        :type args:              :class:`argparse.Namespace`
+        :type args.ratio:        `string`
+        :type args.size:         `integer`
+        :type args.master_hash:  `string`
+        :type args.cache:        :class:`cache.Cache`
+        :type args.down_cmd:     `string`
+        :type args.approximate:  `float`
+        :type args.format:       `string`
+        :type upsampler:         `string`
+        :type metric:            `string`
+
+        :return:                 the key
+        :rtype:                  `string`
+
+        """
+        return args.cache.key(args.master_hash, [
+            args.down_cmd, tools.batch_command(
+                self.upsamplers[upsampler],
+                [('{0}', '{1}', args.ratio, args.size)], args.format),
+            self.metrics[metric][0]
+        ], repr(args.approximate))
+
+    def __upsample(self, args, upsampler, large):
+        """Private method to upsample the downsampled image.
+
+        .. note::
+
+            This is a private method called by :meth:`compute`.
+
+        :param args:           arguments
+        :param args.small:     downsampled image
+        :param args.ratio:     resampling ratio
+        :param args.size:      width of the master image
+        :param args.do_op:     updates the displayed progress
+        :param args.engine:    evaluates the metric commands
+        :param args.format:    extension of the intermediate images
+        :param args.workers:   runs the resampling commands
+        :param upsampler:      name of the upsampler
+        :param large:          path of the upsampled image
+        :type args:            :class:`argparse.Namespace`
+        :type args.small:      `path`
+        :type args.ratio:      `string`
+        :type args.size:       `integer`
+        :type args.do_op:      `function`
+        :type args.engine:     :class:`compare.Engine`
+        :type args.format:     `string`
+        :type args.workers:    :class:`workers.Workers`
+        :type upsampler:       `string`
+        :type large:           `path`
+
+        :return:               digest of the upsampled image
+        :rtype:                `string`
+
+        """
+        # Upsample ratio.tif back to 840 using upsampler.
+        #  {0} input image path (small)
+        #  {1} output image path (large)
+        #  {2} upsampling ratio
+        #  {3} upsampled size (840, unless running a smoke test)
+        #  {ext} extension of the intermediate images
+        args.do_op(args, upsampler)
+        if os.path.isfile(large):
+            # Use the image written by a batch command (see Ratios.compute).
+            return tools.hash_file(large)
+        command = self.upsamplers[upsampler]
+        job = args.small, large, args.ratio, args.size
+        if workers.is_worker(command) or '{1}' in command:
+            args.workers.resample(command, [job], args.format)
+            return tools.hash_file(large)
+
+        # Pass an image computed in-process or written to standard output to
+        # the engine, writing it to the disk only if a metric runs in a
+        # subprocess.
+        write = any(os.path.basename(self.metrics[metric][0].split()[0]) !=
+                    'exquires-compare' for metric in self.metrics)
+        if workers.is_python(command):
+            args.workers.resample(command, [job], args.format, write)
+            return args.engine.digest(large)
+        command = tools.batch_command(command, [job], args.format)
+        return args.engine.run(command, large, args.size, write)
+
+
+def _save_maps(args, upsampler):
+    """Return `True` if the error maps of an upsampler are to be saved.
+
+    .. note::
+
+        This is a private function called by :meth:`Upsamplers.needed` and
+        :meth:`Upsamplers.compute`.
+
+    :param args:           arguments
+    :param args.save_maps: upsamplers to save error maps for
+    :param upsampler:      name of the upsampler
+    :type args:            :class:`argparse.Namespace`
+    :type args.save_maps:  `list of strings`
+    :type upsampler:       `string`
+
+    :return:               `True` if the upsampler matches a pattern
+    :rtype:                `boolean`
+
+    """
+    return any(fnmatch.fnmatch(upsampler, pattern)
+               for pattern in args.save_maps)
+
+
+def _terminate(signum, frame):
+    """Raise :class:`SystemExit` when the process is terminated.
+
+    The scratch trees and the previous database are then restored by
+    :meth:`Operations.compute`, as they are when the process is interrupted.
+
+    .. note::
+
+        This is a private function called when a `SIGTERM` signal is received
+        by :meth:`Operations.compute`.
+
+    :param signum: number of the signal
+    :param frame:  current stack frame
+    :type signum:  `integer`
+    :type frame:   :class:`frame`
+
+    :raises:       :class:`SystemExit`
+
+    """
+    raise SystemExit(128 + signum)
+
+
+def _stamp(path):
+    """Return the size and modification time of a file.
+
+    .. note::
+
+        This is a private function called by :meth:`Images.compute`.
+
+    :param path: the file
+    :type path:  `path`
+
+    :return:     the size and modification time
+    :rtype:      `tuple`
+
+    """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def _master_path(path, directory):
+    """Return the path to pass to the commands for a master image.
+
+    The master image is used in place, since the commands only read it. If its
+    path contains whitespace, which would split it when the commands are
+    parsed, it is hard-linked into the directory of the image instead, or
+    copied when it is on another filesystem.
+
+    .. note::
+
+        This is a private function called by :meth:`Images.compute`.
+
+    :param path:      the master image
+    :param directory: directory to store results for this image
+    :type path:       `path`
+    :type directory:  `path`
+
+    :return:          the path to use
+    :rtype:           `path`
+
+    """
+    if len(path.split()) == 1:
+        return path
+    master = os.path.join(directory,
+                          ''.join(['master', os.path.splitext(path)[1]]))
+    try:
+        os.link(path, master)
+    except OSError:
+        shutil.copyfile(path, master)
+    return master
+
+
+def _free_space(directory):
+    """Return the free space available in a directory.
+
+    .. note::
+
+        This is a private function called by :func:`_scratch_tree`.
+
+    :param directory: the directory
+    :type directory:  `path`
+
+    :return:          the number of bytes available
+    :rtype:           `integer`
+
+    """
+    stat = os.statvfs(directory)
+    return stat.f_bavail * stat.f_frsize
+
+
+def _scratch_tree(args, need):
+    """Return a scratch tree with enough free space for the next image.
+
+    The current tree is kept while it has enough free space. Otherwise, a new
+    tree is created in the preferred scratch directory if it has enough free
+    space, or in the current directory if it does not.
+
+    .. note::
+
+        This is a private function called by :meth:`Images.compute`.
+
+    :param args:         arguments
+    :param args.proj:    name of the current project
+    :param args.scratch: preferred directory for intermediate images
+    :param args.tree:    current scratch tree
+    :param args.trees:   all of the scratch trees created
+    :param need:         number of bytes needed
+    :type args:          :class:`argparse.Namespace`
+    :type args.proj:     `string`
+    :type args.scratch:  `path`
+    :type args.tree:     `path`
+    :type args.trees:    `list of paths`
+    :type need:          `integer`
+
+    :return:             the scratch tree to use
+    :rtype:              `path`
+
+    """
+    if args.tree and _free_space(args.tree) >= need:
+        return args.tree
+
+    # Fall back to the current directory if the scratch directory is full.
+    directory = os.curdir
+    if (os.path.isdir(args.scratch) and os.access(args.scratch, os.W_OK) and
+            _free_space(args.scratch) >= need):
+        directory = args.scratch
+    if args.tree and os.path.samefile(os.path.dirname(args.tree), directory):
+        return args.tree
+
+    tree = tempfile.mkdtemp(prefix=args.proj + '-', dir=directory)
+    args.trees.append(tree)
+    return tree
+
+
+def _halve(args, images):
+    """Drop the worst fraction of the remaining upsamplers.
+
+    The remaining upsamplers are ranked by their merged Spearman ranks (see
+    :func:`stats.get_merged_ranks`) over the tables of the images computed so
+    far, aggregated in the same way as by :ref:`exquires-report`. The worst
+    of them are recorded in the database and skipped for the remaining images,
+    so their results for the images already computed are kept as partial
+    results. At least one upsampler always remains.
+
+    .. note::
+
+        This is a private function called by :meth:`Images.compute`.
+
+    :param args:         arguments
+    :param args.dbase:   connected database
+    :param args.metrics: current metrics
+    :param args.halve:   fraction of upsamplers to drop
+    :param args.pruned:  upsamplers dropped by successive halving
+    :param images:       names of the images computed so far
+    :type args:          :class:`argparse.Namespace`
+    :type args.dbase:    :class:`database.Database`
+    :type args.metrics:  `dict`
+    :type args.halve:    `float`
+    :type args.pruned:   `set of strings`
+    :type images:        `list of strings`
+
+    """
+    tables = args.dbase.get_tables(
+        argparse.Namespace(image=images, down=None, ratio=None))
+    upsamplers = sorted(args.dbase.get_upsamplers(tables) - args.pruned)
+    drop = min(int(len(upsamplers) * args.halve), len(upsamplers) - 1)
+    if drop <= 0:
+        return
+
+    # Rank the remaining upsamplers, from best to worst.
+    metrics_desc = [int(args.metrics[metric][2]) for metric in args.metrics]
+    ranks = stats.get_merged_ranks(
+        stats.get_aggregate_table(args.dbase, upsamplers, args.metrics,
+                                  tables), metrics_desc, 1)
+
+    # Drop the worst upsamplers.
+    for row in ranks[-drop:]:
+        args.dbase.insert_pruned(row[0], len(images))
+        args.pruned.add(row[0])
+
+
+def _smoke_sizes(ratio):
+    """Return the sizes of the crops used for a ratio in smoke-test mode.
+
+    The crop is the smallest square of at least :data:`_SMOKE_SIZE` pixels
+    whose width is divisible by the ratio, so the downsampled crop has an
+    integer size. If there is no such crop smaller than the master image, the
+    master image is used as is.
+
+    .. note::
+
+        This is a private function called by :meth:`Ratios.compute`.
+
+    :param ratio: resampling ratio
+    :type ratio:  `string`
+
+    :return:      width of the crop and of the downsampled crop
+    :rtype:       `tuple of integers`
+
+    """
+    fraction = Fraction(ratio).limit_denominator()
+    crop = -(-_SMOKE_SIZE // fraction.numerator) * fraction.numerator
+    if crop >= _SIZE:
+        crop = _SIZE
+    return crop, int(crop / fraction)
+
+
+def _crop(image, cropped, size):
+    """Write a square crop taken from the centre of an image.
+
+    .. note::
+
+        This is a private function called by :meth:`Ratios.compute`.
+
+    :param image:   image to crop
+    :param cropped: path of the cropped image
+    :param size:    width and height of the crop
+    :type image:    `path`
+    :type cropped:  `path`
+    :type size:     `integer`
+
+    """
+    vimage = __import__('vipsCC', globals(), locals(),
+                        ['VImage'], -1).VImage.VImage(image)
+    left = (vimage.Xsize() - size) // 2
+    top = (vimage.Ysize() - size) // 2
+    vimage.extract_area(left, top, size, size).write(cropped)
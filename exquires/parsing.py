@@ -19,7 +19,7 @@ import sys
 
 from configobj import ConfigObj
 
-from exquires import tools
+from exquires import database, sketch, tools
 from exquires import __version__ as VERSION
 
 # pylint: disable-msg=R0903
@@ -68,6 +68,33 @@ def _format_doc(docstring):
     return re.sub(r'\*{2}', '', re.sub(r'    \* ', u'    \u2022 ', dir2))
 
 
+def _quantile(value):
+    """Parse a percentile of a metric family given as `family:percent`.
+
+    .. note::
+
+        This is a private function called by :class:`StatsParser`.
+
+    :param value: the percentile given on the command line
+    :type value:  `string`
+
+    :return:      the family and the percentile
+    :rtype:       `tuple`
+
+    :raises:      :class:`argparse.ArgumentTypeError`
+
+    """
+    family, dummy, percent = value.partition(':')
+    try:
+        if family not in sketch.FAMILIES or not 0 <= float(percent) <= 100:
+            raise ValueError
+    except ValueError:
+        msg = 'invalid quantile: {} (use FAMILY:PERCENT, FAMILY in {})'
+        raise argparse.ArgumentTypeError(
+            msg.format(value, ', '.join(sorted(sketch.FAMILIES))))
+    return family, percent
+
+
 class ExquiresParser(argparse.ArgumentParser):
 
     """Generic **EXQUIRES** parser.
@@ -130,6 +157,36 @@ class OperationsParser(ExquiresParser):
         self.add_argument('-p', '--proj', metavar='PROJECT',
                           type=str, default='project1',
                           help='name of the project (default: project1)')
+        self.add_argument('-m', '--save-maps', metavar='UPSAMPLER',
+                          type=str, nargs='+', default=[],
+                          help='save error maps for these upsamplers')
+        self.add_argument('-t', '--map-type', metavar='TYPE', type=str,
+                          choices=['float16', 'float32'], default='float16',
+                          help='data type of saved maps (default: float16)')
+        self.add_argument('-k', '--sketch', metavar='FAMILY', type=str,
+                          nargs='+', choices=sorted(sketch.FAMILIES),
+                          default=[],
+                          help='store error histograms for these families')
+        self.add_argument('-a', '--approximate', metavar='FRACTION',
+                          type=float, default=1,
+                          help='sample this fraction of the rows (default: 1)')
+        self.add_argument('-n', '--no-cache', action='store_true',
+                          help='do not use the global result cache')
+        self.add_argument('-d', '--scratch', metavar='DIR', type=str,
+                          default='/dev/shm',
+                          help='directory for temporary files '
+                               '(default: /dev/shm)')
+        self.add_argument('-f', '--format', metavar='FORMAT', type=str,
+                          choices=['tif', 'v', 'npy'], default='tif',
+                          help='format of the intermediate images, '
+                               '`tif`, `v`, or `npy` (default: tif)')
+        if not update:
+            self.add_argument('-S', '--smoke', action='store_true',
+                              help='run on small crops (separate database)')
+            self.add_argument('-H', '--halve', metavar='FRACTION',
+                              type=float, default=0,
+                              help='drop this fraction of methods per image')
+        self.set_defaults(smoke=False, halve=0)
         self.update = update
 
     def parse_args(self, args=None, namespace=None):
@@ -155,7 +212,10 @@ class OperationsParser(ExquiresParser):
         args = super(OperationsParser, self).parse_args(args, namespace)
 
         # Construct the path to the configuration and database files.
-        args.dbase_file = '.'.join([args.proj, 'db'])
+        if args.smoke:
+            args.dbase_file = '.'.join([args.proj, 'smoke', 'db'])
+        else:
+            args.dbase_file = '.'.join([args.proj, 'db'])
         args.config_file = '.'.join([args.proj, 'ini'])
         args.config_bak = '.'.join([args.config_file, 'bak'])
         args.prog = self.prog
@@ -164,15 +224,30 @@ class OperationsParser(ExquiresParser):
         if not os.path.isfile(args.config_file):
             self.error(' '.join(['unrecognized project:', args.proj]))
 
+        # Report an error if the sampled fraction is out of range.
+        if not 0 < args.approximate <= 1:
+            self.error('the fraction must be greater than 0 and at most 1')
+
+        # Report an error if the dropped fraction is out of range.
+        if not 0 <= args.halve < 1:
+            self.error('the dropped fraction must be at least 0 and below 1')
+
         if self.update:
             # Determine if the database can be updated.
             if not (os.path.isfile(args.config_bak) and
                     os.path.isfile(args.dbase_file)):
                 self.error(' '.join([args.proj, 'has not been run']))
+
+            # Partial results of dropped upsamplers cannot be updated.
+            dbase = database.Database(args.dbase_file)
+            pruned = dbase.get_pruned()
+            dbase.close()
+            if pruned:
+                self.error(' '.join([args.proj, 'was run with --halve']))
         else:
             # Create a new database file, backing up any that already exists.
             if os.path.isfile(args.dbase_file):
-                os.rename(args.dbase_file, '.'.join([args.proj, 'db', 'bak']))
+                os.rename(args.dbase_file, '.'.join([args.dbase_file, 'bak']))
 
         # Return the parsed arguments.
         return args
@@ -204,6 +279,9 @@ class StatsParser(ExquiresParser):
                                help='print Spearman (fractional) ranks')
             group.add_argument('-m', '--merge', action='store_true',
                                help='print merged Spearman ranks')
+            self.add_argument('-q', '--quantile', metavar='FAMILY:PERCENT',
+                              type=_quantile, nargs='+', default=[],
+                              help='add error percentiles from histograms')
 
         self.add_argument('-p', '--proj', metavar='PROJECT', type=str,
                           action=ProjectAction,
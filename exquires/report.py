@@ -17,6 +17,9 @@ represents a difference metric. By default, the data across all rows and
 columns of all tables is aggregated. Use the appropriate option flags to
 aggregate across a subset of the database.
 
+Upsamplers dropped by :ref:`exquires-run` :option:`--halve` are only listed
+when every selected table contains a result for them.
+
   **Features:**
 
     * :option:`-R`/:option`--ratio` supports hyphenated ranges
@@ -24,12 +27,15 @@ aggregate across a subset of the database.
     * :option:`-U`/:option:`--up`, :option:`-I`/:option:`--image`,
       :option:`-D`/:option:`--down` and :option:`-M`/:option:`--metric`
       support wildcard characters
+    * :option:`-q`/:option:`--quantile` adds percentiles of the per-pixel
+      errors (for example, 'cmc:95'), estimated by merging the histograms
+      stored by :ref:`exquires-run` :option:`--sketch`
 
 """
 
 from operator import itemgetter
 
-from exquires import database, parsing, stats
+from exquires import database, parsing, sketch, stats
 
 
 def _print_table(args):
@@ -59,6 +65,7 @@ def _print_table(args):
     :param args.merge:      `True` if printing merged Spearman ranks
     :param args.sort:       metric to sort by
     :param args.show_sort:  `True` if the sort column should be displayed
+    :param args.quantile:   (family, percent) percentiles to add as columns
     :type args:             :class:`argparse.Namespace`
     :type args.dbase_file:  `path`
     :type args.image:       `list of strings`
@@ -74,6 +81,7 @@ def _print_table(args):
     :type args.merge:       `boolean`
     :type args.sort:        `string`
     :type args.show_sort:   `boolean`
+    :type args.quantile:    `list of tuples`
 
     """
     # Create a list of the sorting options for each metric.
@@ -96,10 +104,21 @@ def _print_table(args):
     # Get a list of table names to aggregate across.
     tables = dbase.get_tables(args)
 
+    # Omit upsamplers dropped by successive halving before these tables.
+    complete = dbase.get_upsamplers(tables)
+    args.up = [upsampler for upsampler in args.up if upsampler in complete]
+
     # Get the table (list of lists) of aggregate image difference data.
     printdata = stats.get_aggregate_table(dbase, args.up,
                                           args.metrics_d, tables)
 
+    # Add the percentiles estimated from the merged error histograms.
+    for family, percent in args.quantile:
+        metrics_desc.append(int(sketch.FAMILIES[family][1] < 0))
+        for row in printdata:
+            merged = dbase.get_sketch(tables, row[0], family)
+            row.append(merged.quantile(float(percent) / 100))
+
     # Close the database connection.
     dbase.close()
 
@@ -121,6 +140,8 @@ def _print_table(args):
         header = ['upsampler']
         for metric in args.metric:
             header.append(metric)
+        for family, percent in args.quantile:
+            header.append('_'.join([family, 'p' + percent]))
 
         # Remove the sort column if necessary.
         if not args.show_sort:
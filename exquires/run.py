@@ -21,9 +21,36 @@ original size (840x840) using each of the upsamplers. The upsampled images will
 be compared to the original images using each of the metrics and the results
 will be stored in the database file.
 
+If a downsampled image is identical to one already computed for the same image
+and ratio (for example, by another downsampler), the results computed for it
+are copied instead of being computed again. The copied tables are listed once
+the run is complete.
+Likewise, when several upsamplers produce identical images, each metric is
+only evaluated once and its result is reused for the others.
+
 If you make changes to the project file and wish to only compute data for these
 changes rather than recomputing everything, use :ref:`exquires-update`.
 
+To check a new project file quickly, use :option:`--smoke`, which runs the
+whole pipeline on small centre crops of the images and stores the results in a
+separate database (for example, :file:`project1.smoke.db`).
+
+To screen a large number of upsamplers, use :option:`--halve`. After each
+image, the remaining upsamplers are ranked by their merged Spearman ranks over
+the images computed so far, and the given fraction of them with the worst ranks
+is dropped for the rest of the run. The results of a dropped upsampler for the
+images already computed are kept as partial results, and such a database
+cannot be updated with :ref:`exquires-update`.
+
+To save per-pixel error maps for some of the upsamplers, use
+:option:`--save-maps` (see :mod:`maps`).
+To store histograms of the per-pixel errors, which :ref:`exquires-report`
+merges to estimate percentiles, use :option:`--sketch` (see :mod:`sketch`).
+
+The intermediate images are written to :file:`/dev/shm` when it has enough
+free space, and to the current directory otherwise. To use another directory,
+use :option:`--scratch`.
+
 To view aggregated error data, use :ref:`exquires-report`.
 
 """
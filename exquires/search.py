@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# coding: utf-8
+#
+#  Copyright (c) 2012, Adam Turcotte (adam.turcotte@gmail.com)
+#                      Nicolas Robidoux (nicolas.robidoux@gmail.com)
+#  License: BSD 2-Clause License
+#
+#  This file is part of the
+#  EXQUIRES (EXtensible QUantitative Image RESampling) test suite
+#
+
+"""Search for the parameter value that minimizes the error of an upsampler.
+
+The upsampler is given as a command template with the same replacement fields
+as the entries of the [Upsamplers] section of the project file, plus a single
+named field for the parameter to search over (for example,
+`-define filter:blur={blur}`). The images, downsamplers, ratios, and metrics
+are read from the project file.
+
+Each value of the parameter is evaluated by upsampling every downsampled image,
+comparing the results to the master images, and aggregating the results of the
+selected metric. A golden-section search narrows down the range of the
+parameter until the maximum number of evaluations is reached or the range is
+narrower than the tolerance, so it finds the minimum of a unimodal error with
+tens of evaluations rather than the thousands of a grid.
+
+Each evaluated point is cached in a database next to the project database
+(for example, :file:`project1.search.db`), keyed by the expanded command, the
+metric, and the images, downsamplers, and ratios of the project file, so
+calling :ref:`exquires-search` again with the same arguments (or with a wider
+budget) does not evaluate the same point twice. The points are kept apart from
+the project database, which :ref:`exquires-run` replaces by its backup when a
+run fails.
+
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from subprocess import check_output
+
+from configobj import ConfigObj
+
+from exquires import compare, database, parsing, tools, workers
+
+# Width and height of the master images.
+_SIZE = 840
+
+# Ratio of the golden section.
+_GOLDEN = (5 ** 0.5 - 1) / 2
+
+
+class Search(object):
+
+    """This class evaluates an upsampler for values of its parameter.
+
+    The downsampled images are computed once, when the object is created, and
+    kept in a temporary directory until :meth:`close` is called.
+
+    :param template: upsampler command with a named replacement field
+    :param param:    name of the parameter
+    :param config:   project configuration
+    :param metric:   name of the metric to minimize
+    :param dbase:    connected database to cache the results in
+    :type template:  `string`
+    :type param:     `string`
+    :type config:    :class:`configobj.ConfigObj`
+    :type metric:    `string`
+    :type dbase:     :class:`database.Database`
+
+    """
+
+    def __init__(self, template, param, config, metric, dbase):
+        """Create a new :class:`Search` object."""
+        self.template = template
+        self.param = param
+        self.metric = metric
+        self.compare_cmd, self.aggregate_cmd = config['Metrics'][metric][:2]
+        self.sign = -1 if int(config['Metrics'][metric][2]) else 1
+        self.external = (os.path.basename(self.compare_cmd.split()[0]) !=
+                         'exquires-compare')
+        self.dbase = dbase
+        self.engine = compare.Engine()
+        self.workers = workers.Workers(self.engine)
+        self.points = {}
+        self.inputs_hash = _inputs_hash(config, metric)
+        self.directory = tempfile.mkdtemp(prefix='exquires-search-')
+
+        # Downsample each master image by each ratio using each downsampler.
+        self.inputs = []
+        for image, master in config['Images'].items():
+            for down, down_cmd in config['Downsamplers'].items():
+                jobs = []
+                for ratio, small_size in config['Ratios'].items():
+                    small = os.path.join(self.directory, '.'.join(
+                        ['_'.join([image, down, ratio]), 'tif']))
+                    jobs.append((master, small, ratio, small_size))
+                    self.inputs.append((master, small, ratio))
+
+                self.workers.resample(down_cmd, jobs)
+
+    def command(self, value):
+        """Return the upsampler command for a value of the parameter.
+
+        :param value: value of the parameter
+        :type value:  `float`
+
+        :return:      the command, with the other replacement fields intact
+        :rtype:       `string`
+
+        """
+        return self.template.replace(''.join(['{', self.param, '}']),
+                                     _format_value(value))
+
+    def evaluate(self, value):
+        """Return the aggregated error for a value of the parameter.
+
+        :param value: value of the parameter
+        :type value:  `float`
+
+        :return:      the aggregated result of the metric
+        :rtype:       `float`
+
+        """
+        command = self.command(value)
+        result = self.dbase.get_point(command, self.metric,
+                                     self.inputs_hash)
+        if result is None:
+            jobs = []
+            for index, (master, small, ratio) in enumerate(self.inputs):
+                large = os.path.join(self.directory,
+                                     '.'.join(['large', str(index), 'tif']))
+                jobs.append((small, large, ratio, _SIZE))
+
+            # Upsample every image at once if the command allows it.
+            batch = tools.is_batch(command)
+            if batch:
+                self.workers.resample(command, jobs)
+
+            results = []
+            for (master, dummy, dummy), job in zip(self.inputs, jobs):
+                large = job[1]
+                if workers.is_python(command):
+                    self.workers.resample(command, [job], write=self.external)
+                elif workers.is_worker(command) or '{1}' in command:
+                    if not batch:
+                        self.workers.resample(command, [job])
+                else:
+                    self.engine.run(tools.batch_command(command, [job]),
+                                    large, _SIZE, self.external)
+                results.append(self.engine.compare(
+                    self.compare_cmd.format(master, large)))
+                self.engine.release(large)
+                if os.path.isfile(large):
+                    os.remove(large)
+            values = ' '.join(str(res) for res in results)
+            result = float(check_output(
+                self.aggregate_cmd.format(values).split()))
+            self.dbase.insert_point(command, self.metric,
+                                   self.inputs_hash, result)
+        self.points[value] = result
+        return result
+
+    def minimize(self, low, high, evals, tolerance):
+        """Return the best value found by a golden-section search.
+
+        :param low:       lower end of the range to search
+        :param high:      upper end of the range to search
+        :param evals:     maximum number of evaluations
+        :param tolerance: width of the range at which to stop
+        :type low:        `float`
+        :type high:       `float`
+        :type evals:      `integer`
+        :type tolerance:  `float`
+
+        :return:          the best value and its aggregated error
+        :rtype:           `tuple of floats`
+
+        """
+        left = high - _GOLDEN * (high - low)
+        right = low + _GOLDEN * (high - low)
+        f_left = self.sign * self.evaluate(left)
+        f_right = self.sign * self.evaluate(right)
+        count = 2
+        while count < evals and high - low > tolerance:
+            if f_left <= f_right:
+                high, right, f_right = right, left, f_left
+                left = high - _GOLDEN * (high - low)
+                f_left = self.sign * self.evaluate(left)
+            else:
+                low, left, f_left = left, right, f_right
+                right = low + _GOLDEN * (high - low)
+                f_right = self.sign * self.evaluate(right)
+            count += 1
+
+        # Return the best of all the points evaluated.
+        best = min(self.points, key=lambda x: self.sign * self.points[x])
+        return best, self.points[best]
+
+    def close(self):
+        """Stop the workers and remove the downsampled images."""
+        self.workers.close()
+        shutil.rmtree(self.directory, True)
+
+
+def _inputs_hash(config, metric):
+    """Private function to identify the inputs evaluated by a search.
+
+    .. note::
+
+        This is a private function called by :meth:`Search.__init__`.
+
+    :param config: project configuration
+    :param metric: name of the metric to minimize
+    :type config:  :class:`configobj.ConfigObj`
+    :type metric:  `string`
+
+    :return:       digest of the images (and their contents), downsamplers,
+                   ratios, and metric commands
+    :rtype:        `string`
+
+    """
+    parts = []
+    for image, master in config['Images'].items():
+        parts.extend([image, master, tools.hash_file(master)])
+    for section in ('Downsamplers', 'Ratios'):
+        for name, value in config[section].items():
+            parts.extend([section, name, value])
+    parts.extend(config['Metrics'][metric][:2])
+    return hashlib.sha1('\n'.join(parts)).hexdigest()
+
+
+def _format_value(value):
+    """Private function to format a parameter value for a command.
+
+    Values are written with 12 significant digits, so the same search always
+    expands to the same commands and finds them in the cache.
+
+    .. note::
+
+        This is a private function called by :meth:`Search.command` and
+        :func:`main`.
+
+    :param value: value of the parameter
+    :type value:  `float`
+
+    :return:      the formatted value
+    :rtype:       `string`
+
+    """
+    return '%.12g' % value
+
+
+def _get_parser():
+    """Private function to return the argument parser of exquires-search.
+
+    .. note::
+
+        This is a private function called by :func:`main`.
+
+    :return: the argument parser
+    :rtype:  :class:`parsing.ExquiresParser`
+
+    """
+    parser = parsing.ExquiresParser(description=__doc__)
+    parser.add_argument('name', type=str, metavar='NAME',
+                        help='name of the upsampler')
+    parser.add_argument('template', type=str, metavar='COMMAND',
+                        help='upsampler command with a {PARAMETER} field')
+    parser.add_argument('-p', '--proj', metavar='PROJECT', type=str,
+                        default='project1',
+                        help='name of the project (default: project1)')
+    parser.add_argument('-M', '--metric', metavar='METRIC', type=str,
+                        default=None,
+                        help='metric to minimize (default: first)')
+    parser.add_argument('-r', '--range', metavar=('LOW', 'HIGH'),
+                        type=float, nargs=2, default=[0.5, 1.5],
+                        help='range of the parameter (default: 0.5 1.5)')
+    parser.add_argument('-e', '--evals', metavar='EVALS', type=int,
+                        default=20,
+                        help='maximum number of evaluations (default: 20)')
+    parser.add_argument('-t', '--tolerance', metavar='TOLERANCE',
+                        type=float, default=1e-4,
+                        help='width of the range to stop at (default: 1e-4)')
+    return parser
+
+
+def main():
+    """Run :ref:`exquires-search`.
+
+    Print the value of each evaluated point and the best entry found, in the
+    format used by the [Upsamplers] section of the project file.
+
+    """
+    parser = _get_parser()
+    args = parser.parse_args()
+
+    # Read the project file.
+    config_file = '.'.join([args.proj, 'ini'])
+    if not os.path.isfile(config_file):
+        parser.error(' '.join(['unrecognized project:', args.proj]))
+    config = ConfigObj(config_file)
+
+    # Find the parameter to search over.
+    params = set(re.findall(r'{([A-Za-z_]\w*)}', args.template)) - {'ext'}
+    if len(params) != 1:
+        parser.error('the command must have exactly one named field')
+    param = params.pop()
+
+    # Check the metric and the range of the parameter.
+    if args.metric is None:
+        args.metric = config['Metrics'].keys()[0]
+    elif args.metric not in config['Metrics']:
+        parser.error(' '.join(['unrecognized metric:', args.metric]))
+    low, high = sorted(args.range)
+    if args.evals < 2:
+        parser.error('at least two evaluations are required')
+
+    # Perform the search, caching the results apart from the project database.
+    dbase = database.Database('.'.join([args.proj, 'search', 'db']))
+    search = Search(args.template, param, config, args.metric, dbase)
+    try:
+        best, result = search.minimize(low, high, args.evals, args.tolerance)
+    finally:
+        search.close()
+        dbase.close()
+
+    # Print the evaluated points and the best entry.
+    for value in sorted(search.points):
+        print '{}={} {}={}'.format(param, _format_value(value), args.metric,
+                                   search.points[value])
+    print '{} = {}'.format(args.name, search.command(best))
+
+if __name__ == '__main__':
+    main()
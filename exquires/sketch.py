@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# coding: utf-8
+#
+#  Copyright (c) 2012, Adam Turcotte (adam.turcotte@gmail.com)
+#                      Nicolas Robidoux (nicolas.robidoux@gmail.com)
+#  License: BSD 2-Clause License
+#
+#  This file is part of the
+#  EXQUIRES (EXtensible QUantitative Image RESampling) test suite
+#
+
+"""Provides fixed-size, mergeable histograms of per-pixel errors.
+
+A :class:`Sketch` summarizes the per-pixel errors of a metric family (for
+example, the CMC(1:1) colour differences) for one or more comparisons. Its size
+does not depend on the number of pixels, and the sketches of several
+comparisons are merged by adding their counts, so quantiles such as the median
+or the 95th percentile can be estimated across any subset of the database
+without reading the images again.
+
+  **Metric Families:**
+
+    ======= =======================================================
+    NAME    PER-PIXEL VALUES
+    ======= =======================================================
+    srgb    absolute sRGB differences (percentage of maximum value)
+    xyz     absolute XYZ differences
+    cmc     CMC(1:1) colour differences
+    de2000  CIEDE2000 colour differences
+    blur    blurred grayscale differences (percentage of maximum)
+    ssim    SSIM values
+    ======= =======================================================
+
+"""
+
+import numpy
+
+# Number of bins in each sketch.
+BINS = 1024
+
+# Value of a perfect match and the signed span covered by each family.
+FAMILIES = {'srgb': (0.0, 100.0), 'xyz': (0.0, 100.0), 'cmc': (0.0, 100.0),
+            'de2000': (0.0, 100.0), 'blur': (0.0, 100.0),
+            'ssim': (1.0, -2.0)}
+
+
+class Sketch(object):
+
+    """This class provides a histogram of per-pixel errors.
+
+    Each value is mapped to the fraction :math:`t \in [0, 1]` of the span of
+    its family that separates it from a perfect match, and :math:`\sqrt{t}` is
+    binned uniformly. The bins are therefore narrowest for the small errors
+    that make up most of an image, while values outside the span are counted
+    in the first or last bin.
+
+    :param family: name of the metric family
+    :param counts: counts of each bin (default: all zero)
+    :type family:  `string`
+    :type counts:  :class:`numpy.ndarray`
+
+    """
+
+    def __init__(self, family, counts=None):
+        """Create a new :class:`Sketch` object."""
+        self.family = family
+        self.origin, self.span = FAMILIES[family]
+        if counts is None:
+            counts = numpy.zeros(BINS, numpy.int64)
+        self.counts = counts
+
+    def __iadd__(self, other):
+        """Merge the counts of another sketch of the same family.
+
+        :param other: the sketch to merge
+        :type other:  :class:`Sketch`
+
+        :return:      this sketch
+        :rtype:       :class:`Sketch`
+
+        """
+        self.counts = self.counts + other.counts
+        return self
+
+    def add(self, values):
+        """Count an array of values.
+
+        :param values: the values to count
+        :type values:  :class:`numpy.ndarray`
+
+        """
+        self.counts = self.counts + count(values, self.family)
+
+    def quantile(self, fraction):
+        """Estimate a quantile of the counted values.
+
+        The value is interpolated linearly within the bin that contains it.
+
+        :param fraction: the quantile to estimate, in [0, 1]
+        :type fraction:  `float`
+
+        :return:         the estimated quantile (`nan` if the sketch is empty)
+        :rtype:          `float`
+
+        """
+        total = self.counts.sum()
+        if not total:
+            return float('nan')
+
+        # The mapping is decreasing for families where larger is better.
+        if self.span < 0:
+            fraction = 1 - fraction
+
+        # Only the bins that contain values can contain the quantile.
+        nonempty = numpy.flatnonzero(self.counts)
+        cumulative = numpy.cumsum(self.counts)[nonempty]
+        target = min(max(fraction, 0), 1) * total
+        position = min(int(numpy.searchsorted(cumulative, target)),
+                       len(nonempty) - 1)
+        index = nonempty[position]
+        before = cumulative[position] - self.counts[index]
+        within = (target - before) / float(self.counts[index])
+        root = (index + min(max(within, 0), 1)) / float(BINS)
+        return self.origin + self.span * root * root
+
+    def to_blob(self):
+        """Return the counts as a binary string for the database.
+
+        :return: the counts
+        :rtype:  :class:`buffer`
+
+        """
+        return buffer(self.counts.astype('<i8').tostring())
+
+    @classmethod
+    def from_blob(cls, family, blob):
+        """Create a sketch from counts stored in the database.
+
+        :param family: name of the metric family
+        :param blob:   counts returned by :meth:`to_blob`
+        :type family:  `string`
+        :type blob:    :class:`buffer`
+
+        :return:       the sketch
+        :rtype:        :class:`Sketch`
+
+        """
+        return cls(family, numpy.frombuffer(blob, '<i8').astype(numpy.int64))
+
+
+def count(values, family):
+    """Return the bin counts of an array of values.
+
+    :param values: the values to count
+    :param family: name of the metric family
+    :type values:  :class:`numpy.ndarray`
+    :type family:  `string`
+
+    :return:       the counts of each bin
+    :rtype:        :class:`numpy.ndarray`
+
+    """
+    origin, span = FAMILIES[family]
+    fraction = numpy.clip((values - origin) / span, 0, 1)
+    index = numpy.minimum(numpy.sqrt(fraction) * BINS, BINS - 1).astype(int)
+    return numpy.bincount(index.ravel(), minlength=BINS).astype(numpy.int64)
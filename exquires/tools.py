@@ -12,6 +12,7 @@
 """A collection of convenience methods."""
 
 from collections import OrderedDict
+import hashlib
 import os
 
 
@@ -49,3 +50,69 @@ def create_dir(base_dir, relative_dir=''):
     if not os.path.exists(directory):
         os.makedirs(directory)
     return directory
+
+
+def hash_file(path):
+    """Return the SHA-1 digest of the contents of a file.
+
+    :param path: file to hash
+    :type path:  `path`
+
+    :return:     the hexadecimal digest
+    :rtype:      `string`
+
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as hashed:
+        for chunk in iter(lambda: hashed.read(1 << 20), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_batch(command):
+    """Return `True` if a resampling command processes several images.
+
+    :param command: the resampling command
+    :type command:  `string`
+
+    :return:        `True` if part of the command is enclosed by `[` and `]`
+    :rtype:         `boolean`
+
+    """
+    words = command.split()
+    return '[' in words and ']' in words[words.index('['):]
+
+
+def batch_command(command, jobs, ext='tif'):
+    """Return a resampling command with its replacement fields filled in.
+
+    If the words `[` and `]` enclose part of the command, that part is
+    repeated for each job, so a single command resamples every image (for
+    example, with ImageMagick clones). The rest of the command is filled in
+    for the first job. Otherwise, the whole command is filled in for the first
+    job.
+
+    :param command: the resampling command
+    :param jobs:    input path, output path, ratio, and size of each image
+    :param ext:     extension of the intermediate images
+    :type command:  `string`
+    :type jobs:     `list of tuples`
+    :type ext:      `string`
+
+    :return:        the command
+    :rtype:         `string`
+
+    """
+    if not is_batch(command):
+        return command.format(*jobs[0], ext=ext)
+
+    # Repeat the enclosed words for each job.
+    words = command.split()
+    start = words.index('[')
+    stop = words.index(']', start)
+    branch = ' '.join(words[start + 1:stop])
+    parts = [' '.join(words[:start]).format(*jobs[0], ext=ext)]
+    for job in jobs:
+        parts.append(branch.format(*job, ext=ext))
+    parts.append(' '.join(words[stop + 1:]).format(*jobs[0], ext=ext))
+    return ' '.join(part for part in parts if part)
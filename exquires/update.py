@@ -20,6 +20,11 @@ file, the database will not be updated.
 If you wish to recompute all data based on your project file rather than simply
 updating it with the changes, use :ref:`exquires-run`.
 
+To save per-pixel error maps for some of the upsamplers, use
+:option:`--save-maps` (see :mod:`maps`).
+To store histograms of the per-pixel errors, which :ref:`exquires-report`
+merges to estimate percentiles, use :option:`--sketch` (see :mod:`sketch`).
+
 To view aggregated error data, use :ref:`exquires-report`.
 
 """
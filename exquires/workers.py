@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# coding: utf-8
+#
+#  Copyright (c) 2012, Adam Turcotte (adam.turcotte@gmail.com)
+#                      Nicolas Robidoux (nicolas.robidoux@gmail.com)
+#  License: BSD 2-Clause License
+#
+#  This file is part of the
+#  EXQUIRES (EXtensible QUantitative Image RESampling) test suite
+#
+
+"""Runs resampling commands directly, through worker processes, or in-process.
+
+A downsampler or upsampler of the project file whose entry starts with
+`worker:` names a worker command rather than a command to run for each image
+(for example, `worker: python my_resampler.py --blur 0.9`). The worker is
+started the first time it is needed and kept running for the rest of the
+program, which avoids paying its startup time for every image.
+
+The worker reads one request per line on its standard input and writes one
+reply per line on its standard output, both encoded as JSON objects. A request
+has the keys `input`, `output`, `ratio`, and `size`, with the same meaning as
+the replacement fields `{0}` to `{3}` of a command, and the worker replies with
+`{"ok": true}` once the output image has been written, or with
+`{"error": MESSAGE}` if it could not be. When it is started, the worker is sent
+`{"ping": true}` and must reply in the same way.
+
+A worker that exits, writes an invalid reply, or does not reply within
+:data:`TIMEOUT` seconds is restarted, and the request is sent again once.
+
+An entry of the form `py:module:function`, optionally followed by arguments,
+names a Python function that is called in-process (for example,
+`py:my_package.resamplers:nohalo 0.9`). The function is called with the
+decoded sRGB pixels of the input image as a NumPy array (height x width x 3),
+the ratio (a `string`), the size (an `integer`), and the arguments (as
+`strings`), and must return the pixels of the output image in the same form.
+The input and output images are passed to and from the metric engine, so the
+output image is only written to the disk when another program needs it.
+
+"""
+
+import json
+import select
+from subprocess import PIPE, Popen, call
+
+import numpy
+
+from exquires import tools
+
+# Prefix of the entries that name a worker command.
+PREFIX = 'worker:'
+
+# Prefix of the entries that name a Python function.
+PYTHON_PREFIX = 'py:'
+
+# Python functions that have already been loaded, keyed by entry.
+_LOADED = {}
+
+# Number of seconds to wait for the reply of a worker.
+TIMEOUT = 600
+
+
+class Worker(object):
+
+    """This class provides an interface to a worker process.
+
+    :param command: the worker command
+    :type command:  `string`
+
+    """
+
+    def __init__(self, command):
+        """Create a new :class:`Worker` object and start the process."""
+        self.command = command
+        self.process = None
+        self.start()
+
+    def start(self):
+        """Start the process, stopping the previous one if necessary.
+
+        :raises: :class:`RuntimeError` if the worker does not reply to a ping
+
+        """
+        self.stop()
+        self.process = Popen(self.command.split(), stdin=PIPE, stdout=PIPE)
+        if self.__send({'ping': True}) is None:
+            raise RuntimeError(' '.join(['worker did not start:',
+                                         self.command]))
+
+    def request(self, job):
+        """Ask the worker to resample an image.
+
+        :param job: input path, output path, ratio, and size of the image
+        :type job:  `tuple`
+
+        :raises:    :class:`RuntimeError` if the worker reports an error or
+                    fails twice
+
+        """
+        message = dict(zip(['input', 'output', 'ratio', 'size'], job))
+        reply = self.__send(message)
+        if reply is None:
+            # Restart the worker and try once more.
+            self.start()
+            reply = self.__send(message)
+        if reply is None:
+            raise RuntimeError(' '.join(['worker failed:', self.command]))
+        if 'error' in reply:
+            raise RuntimeError(': '.join([self.command, str(reply['error'])]))
+
+    def stop(self):
+        """Stop the process."""
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.kill()
+        self.process.wait()
+        self.process = None
+
+    def __send(self, message):
+        """Private method to send a message and return the reply.
+
+        .. note::
+
+            This is a private method called by :meth:`start` and
+            :meth:`request`.
+
+        :param message: the message
+        :type message:  `dict`
+
+        :return:        the reply, or `None` if the worker has failed
+        :rtype:         `dict`
+
+        """
+        if self.process.poll() is not None:
+            return None
+        try:
+            self.process.stdin.write(json.dumps(message) + '\n')
+            self.process.stdin.flush()
+            if not select.select([self.process.stdout], [], [], TIMEOUT)[0]:
+                return None
+            reply = json.loads(self.process.stdout.readline())
+        except (IOError, ValueError):
+            return None
+        return reply if isinstance(reply, dict) else None
+
+
+class Workers(object):
+
+    """This class runs resampling commands, starting workers as needed.
+
+    Commands that name neither a worker nor a Python function are run in a
+    subprocess. Python functions exchange their images through the engine.
+
+    :param engine: engine that caches the decoded images
+    :type engine:  :class:`compare.Engine`
+
+    """
+
+    def __init__(self, engine):
+        """Create a new :class:`Workers` object."""
+        self.engine = engine
+        self.workers = {}
+
+    def resample(self, command, jobs, ext='tif', write=True):
+        """Resample images with a command.
+
+        A batch command (see :func:`tools.batch_command`) is run once for all
+        of the jobs, and any other command once for each job.
+
+        :param command: the resampling command, `worker:` and the command of
+                        a worker, or `py:` and the path of a function
+        :param jobs:    input path, output path, ratio, and size of each image
+        :param ext:     extension of the intermediate images
+        :param write:   `True` if the images computed by a Python function
+                        must also be written to the disk
+        :type command:  `string`
+        :type jobs:     `list of tuples`
+        :type ext:      `string`
+        :type write:    `boolean`
+
+        """
+        if is_python(command):
+            words = command[len(PYTHON_PREFIX):].split()
+            func = load_resampler(words[0])
+            for image, output, ratio, size in jobs:
+                pixels = self.engine.get_planes(image).get('rgb')
+                self.engine.load(output, numpy.asarray(
+                    func(pixels, ratio, int(size), *words[1:])), write)
+        elif is_worker(command):
+            name = command[len(PREFIX):].strip()
+            if name not in self.workers:
+                self.workers[name] = Worker(name)
+            for job in jobs:
+                self.workers[name].request(job)
+        elif tools.is_batch(command):
+            call(tools.batch_command(command, jobs, ext).split())
+        else:
+            for job in jobs:
+                call(tools.batch_command(command, [job], ext).split())
+
+    def close(self):
+        """Stop all of the workers."""
+        for worker in self.workers.values():
+            worker.stop()
+        self.workers = {}
+
+
+def is_worker(command):
+    """Return `True` if an entry names a worker command.
+
+    :param command: the entry
+    :type command:  `string`
+
+    :return:        `True` if the entry starts with :data:`PREFIX`
+    :rtype:         `boolean`
+
+    """
+    return command.startswith(PREFIX)
+
+
+def is_python(command):
+    """Return `True` if an entry names a Python function.
+
+    :param command: the entry
+    :type command:  `string`
+
+    :return:        `True` if the entry starts with :data:`PYTHON_PREFIX`
+    :rtype:         `boolean`
+
+    """
+    return command.startswith(PYTHON_PREFIX)
+
+
+def load_resampler(path):
+    """Return the Python function of a resampler.
+
+    :param path: the path of the function, as `module:function`
+    :type path:  `string`
+
+    :return:     the function
+    :rtype:      `function`
+
+    :raises:     :class:`ValueError` if the function cannot be loaded
+
+    """
+    if path in _LOADED:
+        return _LOADED[path]
+    if ':' not in path:
+        raise ValueError(' '.join(['invalid resampler:', path]))
+    module, attr = path.split(':', 1)
+    try:
+        func = __import__(module, globals(), locals(), [attr], 0)
+        for part in attr.split('.'):
+            func = getattr(func, part)
+    except (ImportError, AttributeError), error:
+        raise ValueError('cannot load resampler {}: {}'.format(path, error))
+    if not callable(func):
+        raise ValueError(' '.join(['resampler is not callable:', path]))
+    _LOADED[path] = func
+    return func
@@ -51,11 +51,13 @@ CLASSIFIERS = [
 ]
 CONSOLE_SCRIPTS = [
     'exquires-aggregate = exquires.aggregate:main',
+    'exquires-cache = exquires.cache:main',
     'exquires-compare = exquires.compare:main',
     'exquires-correlate = exquires.correlate:main',
     'exquires-new = exquires.new:main',
     'exquires-report = exquires.report:main',
     'exquires-run = exquires.run:main',
+    'exquires-search = exquires.search:main',
     'exquires-update = exquires.update:main'
 ]
 
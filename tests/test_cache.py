@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding: utf-8
+#
+#  Copyright (c) 2012, Adam Turcotte (adam.turcotte@gmail.com)
+#                      Nicolas Robidoux (nicolas.robidoux@gmail.com)
+#  License: BSD 2-Clause License
+#
+#  This file is part of the
+#  EXQUIRES (EXtensible QUantitative Image RESampling) test suite
+#
+
+"""Tests for the cache of metric results shared by all projects."""
+
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+
+from exquires import cache, database, operations
+
+
+class _Engine(object):
+
+    """Stand-in for :class:`compare.Engine` that counts the comparisons."""
+
+    def __init__(self):
+        self.compared = 0
+        self.bounds = None
+
+    def compare(self, command):
+        self.compared += 1
+        return float(len(command) % 7)
+
+    def release(self, image):
+        pass
+
+
+class _Workers(object):
+
+    """Stand-in for :class:`workers.Workers` that writes empty images."""
+
+    def resample(self, command, jobs, ext='tif', write=True):
+        for job in jobs:
+            with open(job[1], 'wb') as image:
+                image.write(command)
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.db')
+        self.metrics = {'srgb_1': ['exquires-compare srgb_1 {0} {1}'],
+                        'cmc_1': ['exquires-compare cmc_1 {0} {1}']}
+        self.upsamplers = {'nearest': 'up -filter point {0} {1}',
+                           'bicubic': 'up -filter cubic {0} {1}'}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, True)
+
+    def run_once(self, name):
+        """Compute a table from scratch, as a new run would."""
+        os.mkdir(os.path.join(self.directory, name))
+        small = os.path.join(self.directory, name, '2.tif')
+        ratio_dir = os.path.join(self.directory, name, '2')
+        os.mkdir(ratio_dir)
+        dbase = database.Database(os.path.join(self.directory,
+                                               name + '.db'))
+        args = argparse.Namespace(
+            dbase=dbase, do_op=lambda *a, **k: None, pruned=set(),
+            small=small, ratio='2', size=840, format='tif',
+            master='master.tif', master_hash='0' * 40,
+            down_cmd='down {0} {1}', approximate=1, save_maps=[], sketch=[],
+            results={}, engine=_Engine(), workers=_Workers(),
+            cache=cache.Cache(self.path), met_same={})
+        args.table = dbase.add_table('wave', 'box', '2', self.metrics)
+        try:
+            operations.Upsamplers(self.upsamplers,
+                                  self.metrics).compute(args, False)
+            rows = dbase.sql_fetchall('SELECT * FROM ' + args.table)
+        finally:
+            args.cache.close()
+            dbase.close()
+        return args.engine.compared, sorted(tuple(row) for row in rows)
+
+    def test_second_run_is_cached(self):
+        """The second run from an empty cache reuses every result."""
+        compared, rows = self.run_once('first')
+        self.assertEqual(compared, 4)
+        compared, cached_rows = self.run_once('second')
+        self.assertEqual(compared, 0)
+        self.assertEqual(cached_rows, rows)
+
+
+if __name__ == '__main__':
+    unittest.main()